@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Corrupted variants per second from the in-memory simulators.
+
+Usage: python benchmarks/bench_corruption.py [--megapixels 0.05 1 12]
+                                             [--variants 20] [--legacy-max 0.05]
+
+"legacy" is the old simulate_lsb_flip (getdata/putdata and a membership test
+against the list of flipped indices, O(pixels x flips)); it only runs up to
+--legacy-max megapixels.  The other columns time simulate_chain on an
+in-memory image: 5% LSB flips alone, and flips -> zeroed region -> JPEG ->
+resize.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import steg_hider
+
+CHAIN = [("lsb_flip", 5), ("zero_region", 2), ("jpeg", 85), ("resize", 0.5)]
+
+
+def legacy_lsb_flip(img, flip_percent):
+    pixels = list(img.getdata())
+    num_flip = int(flip_percent / 100 * len(pixels))
+    flip_indices = random.sample(range(len(pixels)), num_flip)
+    new_pixels = []
+    for i, pixel in enumerate(pixels):
+        if i in flip_indices:
+            r, g, b = pixel[:3]
+            new_pixels.append((r ^ 1, g ^ 1, b ^ 1))
+        else:
+            new_pixels.append(pixel)
+    new_img = Image.new(img.mode, img.size)
+    new_img.putdata(new_pixels)
+    return new_img
+
+
+def per_second(variants, fn, *args):
+    start = time.perf_counter()
+    for seed in range(variants):
+        fn(*args, seed)
+    return variants / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[0.05, 1, 12])
+    parser.add_argument("--variants", type=int, default=20)
+    parser.add_argument("--legacy-max", type=float, default=0.05)
+    args = parser.parse_args()
+
+    print(f"numpy: {steg_hider.np is not None}")
+    print(f"{'MP':>6} {'legacy/s':>9} {'flip/s':>9} {'chain/s':>9}")
+    for mp in args.megapixels:
+        side = int((mp * 1e6) ** 0.5)
+        img = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+        legacy = "-"
+        if mp <= args.legacy_max:
+            rate = per_second(1, lambda image, _: legacy_lsb_flip(image, 5), img)
+            legacy = f"{rate:.2f}"
+        variants = max(1, int(args.variants / max(mp, 1)))
+        flips = per_second(
+            variants,
+            lambda image, seed: steg_hider.simulate_chain(
+                image, [("lsb_flip", 5)], seed=seed
+            ),
+            img,
+        )
+        chained = per_second(
+            variants,
+            lambda image, seed: steg_hider.simulate_chain(image, CHAIN, seed=seed),
+            img,
+        )
+        print(f"{mp:>6g} {legacy:>9} {flips:>9.1f} {chained:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Embed/extract throughput of each LSB engine.
+
+Usage: python benchmarks/bench_engines.py [--megapixels 3] [--payload-kb 256]
+                                          [--bits 1] [--repeat 3]
+                                          [--include-reference]
+
+The reference (PixelAccess) engine is skipped unless asked for: it runs at a
+few hundred KB/s and dominates the run time on anything but tiny covers.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from PIL import Image
+
+import steg_hider
+
+
+def best_of(repeat, fn, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=3)
+    parser.add_argument("--payload-kb", type=int, default=256)
+    parser.add_argument("--bits", type=int, default=1, help="bits per channel")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--include-reference", action="store_true")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    side = int((args.megapixels * 1_000_000) ** 0.5)
+    cover = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    payload = os.urandom(args.payload_kb * 1024)
+    if len(payload) * 8 > side * side * 3 * args.bits:
+        parser.error("payload does not fit in the cover")
+
+    print(
+        f"cover {side}x{side} ({side * side / 1e6:.1f} MP), "
+        f"payload {len(payload)} B, {args.bits} bit(s) per channel"
+    )
+    print(f"default engine: {steg_hider.DEFAULT_ENGINE}")
+    print(f"{'engine':<10} {'embed MB/s':>12} {'read MB/s':>12}")
+    for name in steg_hider.EMBED_ENGINES:
+        if name == "reference" and (args.bits != 1 or not args.include_reference):
+            continue
+        embed = steg_hider.EMBED_ENGINES[name]
+        read = steg_hider.READ_ENGINES[name]
+        t_embed = best_of(
+            args.repeat, lambda: embed(cover.copy(), payload, 0, args.bits)
+        )
+        stego = embed(cover.copy(), payload, 0, args.bits)
+        t_read = best_of(args.repeat, read, stego, len(payload), 0, args.bits)
+        assert read(stego, len(payload), 0, args.bits) == payload
+        mb = len(payload) / 1e6
+        print(f"{name:<10} {mb / t_embed:>12.1f} {mb / t_read:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
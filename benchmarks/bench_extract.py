@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Time to extract a small message from growing PNG covers.
+
+Usage: python benchmarks/bench_extract.py [--megapixels 1 6 24]
+                                          [--message-kb 40] [--repeat 3]
+
+Compares the streaming reader, which stops inflating once the header-declared
+payload is in, with a full decode of the same file.  The streaming column
+should stay roughly flat as the cover grows.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from PIL import Image
+
+import steg_hider
+
+
+def best_of(repeat, fn, *args, **kwargs):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    assert "error" not in result, result
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[1, 6, 24])
+    parser.add_argument("--message-kb", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    message = os.urandom(args.message_kb * 512).hex()
+    print(f"message {len(message)} chars, engine {steg_hider.DEFAULT_ENGINE}")
+    print(f"{'cover':>14} {'streamed s':>12} {'full decode s':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for megapixels in args.megapixels:
+            side = int((megapixels * 1_000_000) ** 0.5)
+            cover = os.path.join(tmp, "cover.png")
+            stego = os.path.join(tmp, "stego.png")
+            # Random pixels keep the cover incompressible, like a photo
+            Image.frombytes("RGB", (side, side), os.urandom(side * side * 3)).save(
+                cover, compress_level=1
+            )
+            steg_hider.hide_message(cover, message, stego)
+
+            streamed = best_of(
+                args.repeat, steg_hider.extract_message, stego, streaming=True
+            )
+            full = best_of(
+                args.repeat, steg_hider.extract_message, stego, streaming=False
+            )
+            label = f"{side}x{side}"
+            print(f"{label:>14} {streamed:>12.3f} {full:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""Startup cost of the package and the web entry points, against a budget.
+
+Usage: python benchmarks/bench_import.py [--repeat 5] [--top 8]
+           [--budget benchmarks/import_budget.json] [--check]
+
+Each target is imported in a fresh interpreter under `python -X importtime`.
+The report gives the best wall time of --repeat runs, the modules the
+import pulled in (cumulative time) and the --top costliest direct imports of
+each.
+
+The budget file gives every target a time limit in milliseconds and a list
+of modules that must not be loaded at import time (they are imported on
+first use instead).  --check exits with status 1 when a target is over its
+limit or loads a forbidden module.
+
+Source files without a matching .pyc are compiled on every run, so measure
+with bytecode caching enabled (PYTHONDONTWRITEBYTECODE unset) for numbers
+that match a deployed app.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_BUDGET = os.path.join(ROOT, "benchmarks", "import_budget.json")
+
+TARGETS = {
+    "steg_hider": "import steg_hider",
+    "api/index.py": "import runpy; runpy.run_path('api/index.py')",
+    "steghider/web/app.py": "import runpy; runpy.run_path('steghider/web/app.py')",
+}
+
+MARKER = "-- bench_import start --"
+
+# Runs in the child: the marker separates interpreter startup from the
+# target's imports in the -X importtime output on stderr.
+CHILD = """
+import sys, time, json
+sys.stderr.write({marker!r} + "\\n")
+sys.stderr.flush()
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "modules": sorted(sys.modules)}}))
+"""
+
+
+def parse_importtime(stderr):
+    """Returns [(module, cumulative seconds, children)] for the top-level imports.
+
+    children lists the direct imports of each module the same way, without
+    their own children.  -X importtime prints a module after its imports and
+    indents it by two spaces per level.
+    """
+    lines = stderr.splitlines()
+    if MARKER in lines:
+        lines = lines[lines.index(MARKER) + 1 :]
+    modules, pending = [], []
+    for line in lines:
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entry = (name.strip(), int(cumulative) / 1e6)
+        if depth == 0:
+            modules.append(entry + (pending,))
+            pending = []
+        elif depth == 1:
+            pending.append(entry)
+    return modules
+
+
+def measure(statement):
+    """Imports statement in a fresh interpreter; returns (seconds, modules, top)."""
+    child = CHILD.format(marker=MARKER, statement=statement)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", child],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return report["seconds"], report["modules"], parse_importtime(result.stderr)
+
+
+def loaded(modules, name):
+    return any(m == name or m.startswith(name + ".") for m in modules)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--budget", default=DEFAULT_BUDGET)
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.budget) as f:
+        budget = json.load(f)
+
+    failures = []
+    for target, statement in TARGETS.items():
+        runs = [measure(statement) for _ in range(args.repeat)]
+        seconds, modules, top = min(runs, key=lambda run: run[0])
+        limit = budget.get(target, {})
+        max_ms = limit.get("max_ms")
+        forbidden = [m for m in limit.get("forbidden", []) if loaded(modules, m)]
+
+        status = "ok"
+        if max_ms is not None and seconds * 1000 > max_ms:
+            status = "OVER BUDGET"
+            failures.append(f"{target}: {seconds * 1000:.0f} ms > {max_ms} ms")
+        if forbidden:
+            status = "OVER BUDGET"
+            failures.append(f"{target}: imports {', '.join(forbidden)} at startup")
+        print(
+            f"{target:<22} {seconds * 1000:8.1f} ms"
+            f"  (budget {max_ms if max_ms is not None else '-'} ms)  {status}"
+        )
+        for name, cost, children in sorted(top, key=lambda item: -item[1]):
+            print(f"    {name:<30} {cost * 1000:8.1f} ms")
+            for child, child_cost in sorted(children, key=lambda item: -item[1])[
+                : args.top
+            ]:
+                print(f"      {child:<28} {child_cost * 1000:8.1f} ms")
+
+    if failures:
+        print("\nImport-time budget exceeded:")
+        for failure in failures:
+            print(f"  {failure}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Parity needed to survive burst damage, with and without interleaving.
+
+Usage: python benchmarks/bench_interleave.py [--levels 1 2 5 10]
+                                             [--nsym 4 8 16 24 32 48 64]
+                                             [--trials 3] [--payload-kb 8]
+
+For each damage model and level (percent of the payload's rows), finds the
+smallest nsym from --nsym that recovers the payload in every trial.
+"zero" blacks out a full-width band of rows at a random height inside the
+payload; "crop" cuts that many rows off the bottom of the payload.
+"-" means no candidate nsym was enough.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import steg_hider
+
+
+def make_cover(path, size, seed=0):
+    rng = random.Random(seed)
+    img = Image.frombytes("RGB", size, rng.randbytes(size[0] * size[1] * 3))
+    img.save(path)
+
+
+def payload_rows(path):
+    with Image.open(path) as img:
+        header = steg_hider.parse_header(
+            steg_hider._read_stdlib(img, steg_hider.HEADER_BLOCK_SIZE)
+        )
+        used = steg_hider.HEADER_BLOCK_SIZE + header["payload_length"]
+        used += steg_hider.rs_checksums_size(
+            header["payload_length"], header["checksum_group"]
+        )
+        return -(-used * 8 // (3 * img.width))
+
+
+def damage(stego, damaged, model, rows, first, last, rng):
+    with Image.open(stego) as img:
+        if model == "zero":
+            top = rng.randrange(first, max(first + 1, last - rows))
+            img.paste((0, 0, 0), (0, top, img.width, top + rows))
+        else:
+            img = img.crop((0, 0, img.width, last - rows))
+        img.save(damaged)
+
+
+def recovers(tmp, cover, message, nsym, interleave, model, percent, trials):
+    stego = os.path.join(tmp, "stego.png")
+    damaged = os.path.join(tmp, "damaged.png")
+    steg_hider.hide_message(
+        cover, message, stego, enable_rs=True, nsym=nsym, interleave=interleave
+    )
+    # Leave the header rows alone: the test is about payload bursts
+    first, last = 2, payload_rows(stego)
+    rows = max(1, round((last - first) * percent / 100))
+    rng = random.Random(nsym * 1000 + percent)
+    for _ in range(trials):
+        damage(stego, damaged, model, rows, first, last, rng)
+        if steg_hider.extract_message(damaged).get("data") != message:
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--levels", type=float, nargs="+", default=[1, 2, 5, 10])
+    parser.add_argument(
+        "--nsym", type=int, nargs="+", default=[4, 8, 16, 24, 32, 48, 64]
+    )
+    parser.add_argument("--trials", type=int, default=3)
+    parser.add_argument("--payload-kb", type=int, default=8)
+    args = parser.parse_args()
+    steg_hider.logging.disable(steg_hider.logging.CRITICAL)
+
+    rng = random.Random(1)
+    size = args.payload_kb * 1024
+    message = "".join(chr(33 + rng.randrange(90)) for _ in range(size))
+    side = int((size * 8 * 4) ** 0.5)
+    print(f"payload {size} bytes, cover {side}x{side}, {args.trials} trials")
+    print(f"{'model':>6} {'rows %':>7} {'plain nsym':>11} {'interleaved':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        cover = os.path.join(tmp, "cover.png")
+        make_cover(cover, (side, side))
+        for model in ("zero", "crop"):
+            for percent in args.levels:
+                best = []
+                for interleave in (False, True):
+                    found = next(
+                        (
+                            nsym
+                            for nsym in args.nsym
+                            if recovers(
+                                tmp,
+                                cover,
+                                message,
+                                nsym,
+                                interleave,
+                                model,
+                                percent,
+                                args.trials,
+                            )
+                        ),
+                        None,
+                    )
+                    best.append("-" if found is None else str(found))
+                print(f"{model:>6} {percent:>7g} {best[0]:>11} {best[1]:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Robustness matrix: corruption x parity x interleaving x cover x payload.
+
+Usage: python benchmarks/bench_robustness.py [--megapixels 0.3 1]
+           [--payload-kb 1 16] [--nsym 0 16 32 64] [--trials 3]
+           [--damage lsb_flip:1 lsb_flip:5 zero_region:2 crop:2 jpeg:90]
+           [--workers N] [--output report.json]
+
+Each cell hides a random text payload in a seeded noise cover with one
+(megapixels, payload, nsym, interleave) setting; nsym 0 means no RS.  The
+stego image is then damaged --trials times per --damage model:level (see
+steg_hider.CORRUPTION_MODELS) and extracted.  Cells run in parallel over a
+process pool.  The JSON report holds, per cell, embed and clean-extract
+throughput, capacity overhead (bytes embedded / payload bytes, header and
+checksums included) and the recovery rate for every damage model.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import steg_hider
+
+
+def run_cell(cell):
+    megapixels, payload_kb, nsym, interleave, damage, trials = cell
+    logging.disable(logging.CRITICAL)
+    steg_hider.RS_WORKERS = 1  # the cells already use every core
+    rng = random.Random(f"{megapixels}:{payload_kb}")
+    side = int((megapixels * 1e6) ** 0.5)
+    message = "".join(chr(33 + rng.randrange(90)) for _ in range(payload_kb * 1024))
+    result = {
+        "megapixels": megapixels,
+        "payload_bytes": len(message),
+        "nsym": nsym,
+        "interleave": interleave,
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        cover = os.path.join(tmp, "cover.png")
+        stego = os.path.join(tmp, "stego.png")
+        damaged = os.path.join(tmp, "damaged.png")
+        Image.frombytes("RGB", (side, side), rng.randbytes(side * side * 3)).save(cover)
+        start = time.perf_counter()
+        try:
+            steg_hider.hide_message(
+                cover,
+                message,
+                stego,
+                enable_rs=nsym > 0,
+                nsym=nsym or 10,
+                interleave=interleave,
+            )
+        except ValueError as exc:
+            result["error"] = str(exc)
+            return result
+        embed_s = time.perf_counter() - start
+        start = time.perf_counter()
+        clean = steg_hider.extract_message(stego).get("data") == message
+        extract_s = time.perf_counter() - start
+
+        with Image.open(stego) as img:
+            header = steg_hider.parse_header(
+                steg_hider._read_stdlib(img, steg_hider.HEADER_BLOCK_SIZE)
+            )
+        embedded = steg_hider.HEADER_BLOCK_SIZE + header["payload_length"]
+        if header["checksum_group"]:
+            embedded += steg_hider.rs_checksums_size(
+                header["payload_length"], header["checksum_group"]
+            )
+        mb = len(message) / 1e6
+        result.update(
+            embed_mb_s=round(mb / embed_s, 3),
+            extract_mb_s=round(mb / extract_s, 3),
+            overhead=round(embedded / len(message), 4),
+            clean=clean,
+            recovery={},
+        )
+        for name, level in damage:
+            recovered = 0
+            for trial in range(trials):
+                steg_hider.simulate_chain(stego, [(name, level)], damaged, seed=trial)
+                recovered += steg_hider.extract_message(damaged).get("data") == message
+            result["recovery"][f"{name}:{level:g}"] = recovered / trials
+    return result
+
+
+def parse_damage(spec):
+    name, level = spec.split(":")
+    if name not in steg_hider.CORRUPTION_MODELS:
+        raise argparse.ArgumentTypeError(
+            f"unknown model {name!r}, choose from {list(steg_hider.CORRUPTION_MODELS)}"
+        )
+    return name, float(level)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[0.3, 1])
+    parser.add_argument("--payload-kb", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--nsym", type=int, nargs="+", default=[0, 16, 32, 64])
+    parser.add_argument("--trials", type=int, default=3)
+    parser.add_argument(
+        "--damage",
+        type=parse_damage,
+        nargs="+",
+        default=[
+            ("lsb_flip", 1),
+            ("lsb_flip", 5),
+            ("zero_region", 2),
+            ("crop", 2),
+            ("jpeg", 90),
+            ("resize", 0.9),
+        ],
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    cells = [
+        (mp, kb, nsym, interleave, args.damage, args.trials)
+        for mp, kb, nsym in itertools.product(
+            args.megapixels, args.payload_kb, args.nsym
+        )
+        for interleave in ((False, True) if nsym else (False,))
+    ]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as pool:
+        results = list(pool.map(run_cell, cells))
+    report = {
+        "engine": steg_hider.DEFAULT_ENGINE,
+        "rs_backend": steg_hider._rs_backend.__name__,
+        "trials": args.trials,
+        "seconds": round(time.perf_counter() - start, 1),
+        "cells": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"{len(results)} cells in {report['seconds']} s -> {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
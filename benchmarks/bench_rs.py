@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Reed-Solomon latency on small payloads and throughput on large ones.
+
+Usage: python benchmarks/bench_rs.py [--sizes 32 256 1024] [--nsym 10]
+                                     [--calls 2000] [--large-kb 1024]
+
+Small payloads: "fresh codec" builds a new RSCodec for every call, as
+rs_encode/rs_decode used to; "cached" goes through get_rs_codec.
+Large payloads: reedsolo's codeword-at-a-time codec against rs_encode and
+rs_decode, which batch whole codewords with NumPy when it is installed.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import steg_hider
+
+
+def per_call_us(calls, fn, *args):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn(*args)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def fresh_encode(data, nsym):
+    return steg_hider._rs_backend.RSCodec(nsym).encode(data)
+
+
+def fresh_decode(data, nsym):
+    return steg_hider._rs_backend.RSCodec(nsym).decode(data)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[32, 256, 1024])
+    parser.add_argument("--nsym", type=int, default=10)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--large-kb", type=int, default=1024)
+    args = parser.parse_args()
+
+    print(f"backend: {steg_hider._rs_backend.__name__}, nsym={args.nsym}")
+    print(f"{'bytes':>6} {'op':>7} {'fresh codec us':>15} {'cached us':>10}")
+    for size in args.sizes:
+        data = os.urandom(size)
+        encoded = steg_hider.rs_encode(data, args.nsym)
+        calls = max(10, args.calls * 32 // max(size, 32))
+        for op, fresh, cached, arg in (
+            ("encode", fresh_encode, steg_hider.rs_encode, data),
+            ("decode", fresh_decode, steg_hider.rs_decode, encoded),
+        ):
+            before = per_call_us(calls, fresh, arg, args.nsym)
+            after = per_call_us(calls, cached, arg, args.nsym)
+            print(f"{size:>6} {op:>7} {before:>15.1f} {after:>10.1f}")
+
+    data = os.urandom(args.large_kb * 1024)
+    codec = steg_hider.get_rs_codec(args.nsym)
+    encoded = steg_hider.rs_encode(data, args.nsym)
+    mb = len(data) / 1e6
+    print(f"\n{len(data)} bytes {'codec MB/s':>12} {'rs_* MB/s':>10}")
+    for op, slow, fast, arg in (
+        ("encode", codec.encode, steg_hider.rs_encode, data),
+        ("decode", codec.decode, steg_hider.rs_decode, encoded),
+    ):
+        before = per_call_us(1, slow, arg) / 1e6
+        after = per_call_us(1, fast, arg, args.nsym) / 1e6
+        print(f"{op:>12} {mb / before:>12.2f} {mb / after:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
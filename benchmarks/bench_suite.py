@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""Performance suite for the public API, with a JSON baseline and a gate.
+
+Usage: python benchmarks/bench_suite.py [--megapixels 0.3 3 12 48]
+           [--payload-kb 1 64 1024] [--repeat 3] [--only REGEX]
+           [--save results.json] [--compare baseline.json]
+           [--current results.json] [--threshold 0.25]
+           [--memory-threshold 0.25] [--min-delta 0.002]
+
+Cases: hide_message and extract_message (with and without RS) for every
+cover x payload that fits, calculate_capacity and metawipe_image per cover,
+rs_encode/rs_decode, encrypt_message/decrypt_message per payload, and
+derive_key.
+
+Every case runs in a fresh worker process.  It records the best wall time
+of --repeat runs, throughput in MB/s (payload bytes, or cover pixel bytes
+for per-image cases), peak RSS during the timed runs (VmHWM, reset before
+them where Linux allows it), and the peak of Python allocations from a
+separate run under tracemalloc.
+
+--save writes the results as a baseline.  --compare runs the suite (or
+loads --current) and exits with status 1 if any case is slower than the
+baseline by more than --threshold, or uses more peak RSS than
+--memory-threshold allows.  Slowdowns under --min-delta seconds are
+treated as timer noise.
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import steg_hider
+
+MB = 1e6
+
+
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def message_of(kb):
+    rng = random.Random(kb)
+    return "".join(chr(33 + rng.randrange(90)) for _ in range(kb * 1024))
+
+
+def prepare(case, tmp):
+    """Returns (fn, nbytes) for a case; setup work is not timed."""
+    kind = case["kind"]
+    cover = case.get("cover")
+    out = os.path.join(tmp, "out.png")
+    if kind in ("hide", "extract"):
+        message = message_of(case["payload_kb"])
+        options = {"enable_rs": case["rs"], "nsym": 10}
+        if kind == "hide":
+            return (
+                lambda: steg_hider.hide_message(cover, message, out, **options),
+                len(message),
+            )
+        steg_hider.hide_message(cover, message, out, **options)
+        return lambda: steg_hider.extract_message(out), len(message)
+    if kind == "capacity":
+        return lambda: steg_hider.calculate_capacity(cover), case["pixel_bytes"]
+    if kind == "metawipe":
+        return lambda: steg_hider.metawipe_image(cover, out), case["pixel_bytes"]
+    if kind == "derive_key":
+        return lambda: steg_hider.derive_key("correct horse", b"\0" * 16), 0
+    data = os.urandom(case["payload_kb"] * 1024)
+    if kind == "rs_encode":
+        return lambda: steg_hider.rs_encode(data, 10), len(data)
+    if kind == "rs_decode":
+        encoded = steg_hider.rs_encode(data, 10)
+        return lambda: steg_hider.rs_decode(encoded, 10), len(data)
+    public = os.path.join(tmp, "public.pem")
+    private = os.path.join(tmp, "private.pem")
+    with contextlib.redirect_stdout(None):
+        steg_hider.generate_keys(private, public)
+    if kind == "encrypt":
+        return lambda: steg_hider.encrypt_message(data, public), len(data)
+    encrypted = steg_hider.encrypt_message(data, public)
+    return lambda: steg_hider.decrypt_message(encrypted, private), len(data)
+
+
+def run_case(case):
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp:
+        fn, nbytes = prepare(case, tmp)
+        reset_peak_rss()
+        best = float("inf")
+        for _ in range(case["repeat"]):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        rss = peak_rss_mb()
+        tracemalloc.start()
+        fn()
+        py_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        "seconds": round(best, 6),
+        "mb_s": round(nbytes / MB / best, 3) if nbytes else None,
+        "peak_rss_mb": round(rss, 1),
+        "py_peak_mb": round(py_peak / MB, 2),
+    }
+
+
+def build_cases(args, tmp):
+    cases = {}
+    for kb in args.payload_kb:
+        for kind in ("rs_encode", "rs_decode", "encrypt", "decrypt"):
+            cases[f"{kind}/{kb}kb"] = {"kind": kind, "payload_kb": kb}
+    cases["derive_key"] = {"kind": "derive_key"}
+    for mp in args.megapixels:
+        side = int((mp * MB) ** 0.5)
+        cover = os.path.join(tmp, f"cover-{mp:g}mp.png")
+        rng = random.Random(side)
+        Image.frombytes("RGB", (side, side), rng.randbytes(side * side * 3)).save(
+            cover, compress_level=1
+        )
+        per_image = {"cover": cover, "pixel_bytes": side * side * 3}
+        cases[f"capacity/{mp:g}mp"] = {"kind": "capacity", **per_image}
+        cases[f"metawipe/{mp:g}mp"] = {"kind": "metawipe", **per_image}
+        for kb in args.payload_kb:
+            # RS and compression roughly cancel out; leave room for both
+            if kb * 1024 * 1.2 > side * side * 3 / 8:
+                continue
+            for kind in ("hide", "extract"):
+                for rs in (False, True):
+                    name = f"{kind}{'_rs' if rs else ''}/{mp:g}mp/{kb}kb"
+                    cases[name] = {"kind": kind, "cover": cover, "payload_kb": kb}
+                    cases[name]["rs"] = rs
+    if args.only:
+        cases = {k: v for k, v in cases.items() if re.search(args.only, k)}
+    for case in cases.values():
+        case["repeat"] = args.repeat
+    return cases
+
+
+def run_suite(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = build_cases(args, tmp)
+        results = {}
+        # One process per case, so peak memory is per case
+        with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+            for name, case in cases.items():
+                results[name] = pool.apply(run_case, (case,))
+                r = results[name]
+                rate = f"{r['mb_s']:>9.2f}" if r["mb_s"] is not None else f"{'-':>9}"
+                print(
+                    f"{name:<28} {r['seconds']:>10.4f} {rate} "
+                    f"{r['peak_rss_mb']:>9.1f} {r['py_peak_mb']:>9.2f}"
+                )
+    return {
+        "engine": steg_hider.DEFAULT_ENGINE,
+        "rs_backend": steg_hider._rs_backend.__name__,
+        "python": sys.version.split()[0],
+        "cpus": os.cpu_count(),
+        "cases": results,
+    }
+
+
+def compare(baseline, current, threshold, memory_threshold, min_delta):
+    """Prints current against baseline; returns the regressed case names."""
+    regressed = []
+    print(f"\n{'case':<28} {'base s':>10} {'now s':>10} {'time':>7} {'rss':>7}")
+    for name, now in current["cases"].items():
+        base = baseline["cases"].get(name)
+        if base is None:
+            print(f"{name:<28} {'(new)':>10} {now['seconds']:>10.4f}")
+            continue
+        slower = now["seconds"] / base["seconds"] - 1
+        bigger = now["peak_rss_mb"] / base["peak_rss_mb"] - 1
+        flag = ""
+        slow = slower > threshold and now["seconds"] - base["seconds"] > min_delta
+        if slow or bigger > memory_threshold:
+            regressed.append(name)
+            flag = "  REGRESSED"
+        print(
+            f"{name:<28} {base['seconds']:>10.4f} {now['seconds']:>10.4f} "
+            f"{slower:>+7.0%} {bigger:>+7.0%}{flag}"
+        )
+    for name in sorted(baseline["cases"].keys() - current["cases"].keys()):
+        print(f"{name:<28} (missing from this run)")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[0.3, 3, 12, 48])
+    parser.add_argument("--payload-kb", type=int, nargs="+", default=[1, 64, 1024])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="only run cases whose name matches")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to gate against")
+    parser.add_argument("--current", help="compare these saved results instead")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--memory-threshold", type=float, default=0.25)
+    parser.add_argument(
+        "--min-delta",
+        type=float,
+        default=0.002,
+        help="ignore slowdowns of fewer seconds than this (timer noise)",
+    )
+    args = parser.parse_args()
+
+    if args.current:
+        with open(args.current) as f:
+            current = json.load(f)
+    else:
+        print(f"{'case':<28} {'best s':>10} {'MB/s':>9} {'RSS MB':>9} {'py MB':>9}")
+        current = run_suite(args)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2)
+            f.write("\n")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressed = compare(
+            baseline, current, args.threshold, args.memory_threshold, args.min_delta
+        )
+        if regressed:
+            print(f"\n{len(regressed)} case(s) regressed: {', '.join(regressed)}")
+            sys.exit(1)
+        print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
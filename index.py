@@ -1,16 +1,27 @@
-from flask import Flask, render_template, request, send_file, redirect, url_for
+from flask import (
+    Flask,
+    Response,
+    g,
+    render_template,
+    request,
+    send_file,
+    redirect,
+    url_for,
+)
 import os
+import time
 import uuid
-import zipfile
 import base64
 import io
-import qrcode
 from steg_hider import (
     embed_nft_secret,
     extract_nft_secret,
     hide_message,
     extract_message,
     metawipe_image,
+    enable_metrics,
+    record_metric,
+    render_metrics,
 )
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
@@ -21,6 +32,54 @@ app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 # Ensure upload folder exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Prometheus metrics served at /metrics, including the core's stage timings
+enable_metrics()
+
+
+@app.before_request
+def start_timer():
+    g.start_time = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    record_metric(
+        "steghider_http_requests_total",
+        route=route,
+        method=request.method,
+        status=response.status_code,
+    )
+    record_metric(
+        "steghider_http_request_duration_seconds",
+        time.perf_counter() - g.start_time,
+        route=route,
+    )
+    if request.content_length:
+        record_metric(
+            "steghider_http_uploaded_bytes_total", request.content_length, route=route
+        )
+    return response
+
+
+def record_image(data):
+    """Records the size of an uploaded image for /metrics."""
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            width, height = img.size
+    except Exception:
+        return
+    record_metric(
+        "steghider_image_megapixels", width * height / 1e6, route=request.url_rule.rule
+    )
+
+
+@app.route("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
 
 @app.route("/")
 def index():
@@ -54,6 +113,7 @@ def embed():
     # Prepare payload
     payload = {}
     has_content = False
+    payload_bytes = 0
 
     # Handle File
     if secret_file and secret_file.filename != "":
@@ -62,10 +122,12 @@ def embed():
         payload["type"] = "file"
         payload["name"] = secret_file.filename
         payload["data"] = b64_data
+        payload_bytes += len(file_data)
         has_content = True
 
     # Handle Message
     if message:
+        payload_bytes += len(message.encode("utf-8"))
         if has_content:
             # If we already have a file, add the message as a secondary field
             payload["text_content"] = message
@@ -77,15 +139,12 @@ def embed():
 
     if not has_content:
         return "No message or file to hide", 400
+    record_metric("steghider_payload_bytes", payload_bytes, operation="embed")
 
-    # Save input image
-    ext = os.path.splitext(image.filename)[1]
+    # The cover and the stego image never touch the disk
+    image_data = image.read()
+    record_image(image_data)
     unique_id = str(uuid.uuid4())
-    input_path = os.path.join(app.config["UPLOAD_FOLDER"], f"{unique_id}_input{ext}")
-    image.save(input_path)
-
-    output_filename = f"secret_{unique_id}.png"
-    output_path = os.path.join(app.config["UPLOAD_FOLDER"], output_filename)
 
     pub_key_path = None
 
@@ -118,9 +177,9 @@ def embed():
     # Call the logic
     try:
         result = hide_message(
-            input_path,
+            image_data,
             payload,
-            output_path,
+            None,
             pub_key_path,
             password,
             level,
@@ -128,28 +187,25 @@ def embed():
             nsym=nsym,
             auto_tune=auto_tune,
             expected_corruption=expected_corruption,
+            workers=1,  # no process pool per request
         )
         score = result.get("score", 0)
     except Exception as e:
         return f"Error embedding message: {str(e)}", 500
 
-    # Cleanup input files
+    # Cleanup the uploaded key
     try:
-        os.remove(input_path)
         if pub_key_path:
             os.remove(pub_key_path)
     except:
         pass
 
-    if os.path.exists(output_path):
-        return send_file(
-            output_path, as_attachment=True, download_name="secret_image.png"
-        )
-    else:
-        return (
-            "Failed to create output image. Message might be too long or an error occurred.",
-            500,
-        )
+    return send_file(
+        io.BytesIO(result["output"]),
+        mimetype="image/png",
+        as_attachment=True,
+        download_name="secret_image.png",
+    )
 
 
 @app.route("/extract", methods=["POST"])
@@ -168,11 +224,9 @@ def extract():
     if image.filename == "":
         return "No selected file", 400
 
-    # Save input image
-    ext = os.path.splitext(image.filename)[1]
+    image_data = image.read()
+    record_image(image_data)
     unique_id = str(uuid.uuid4())
-    input_path = os.path.join(app.config["UPLOAD_FOLDER"], f"{unique_id}_extract{ext}")
-    image.save(input_path)
 
     priv_key_path = None
     if is_encrypted and not password:
@@ -191,7 +245,12 @@ def extract():
     # Call the logic
     try:
         extracted_data = extract_message(
-            input_path, priv_key_path, password, enable_rs=enable_rs, nsym=nsym
+            image_data,
+            priv_key_path,
+            password,
+            enable_rs=enable_rs,
+            nsym=nsym,
+            workers=1,  # no process pool per request
         )
     except Exception as e:
         return (
@@ -201,7 +260,6 @@ def extract():
 
     # Cleanup
     try:
-        os.remove(input_path)
         if priv_key_path:
             os.remove(priv_key_path)
     except:
@@ -215,9 +273,11 @@ def extract():
         if extracted_data.get("error"):
             error_msg = extracted_data["error"]
         else:
+            payload_bytes = 0
             # Handle new format (text and/or file)
             if "text" in extracted_data:
                 extracted_text = extracted_data["text"]
+                payload_bytes += len(extracted_text.encode("utf-8"))
 
             if "file" in extracted_data:
                 file_info = extracted_data["file"]
@@ -225,6 +285,7 @@ def extract():
                 b64_data = file_info.get("data")
                 try:
                     file_bytes = base64.b64decode(b64_data)
+                    payload_bytes += len(file_bytes)
                     # Save to disk for download
                     download_filename = f"extracted_{uuid.uuid4().hex[:8]}_{file_name}"
                     download_path = os.path.join(
@@ -240,15 +301,18 @@ def extract():
             if "type" in extracted_data:
                 if extracted_data["type"] == "text":
                     extracted_text = extracted_data["data"]
+                    payload_bytes += len(extracted_text.encode("utf-8"))
                 elif extracted_data["type"] == "file":
                     file_name = extracted_data.get("name", "secret_file")
                     b64_data = extracted_data.get("data")
                     # Check for accompanying text (new feature)
                     if "text_content" in extracted_data:
                         extracted_text = extracted_data["text_content"]
+                        payload_bytes += len(extracted_text.encode("utf-8"))
 
                     try:
                         file_bytes = base64.b64decode(b64_data)
+                        payload_bytes += len(file_bytes)
                         download_filename = (
                             f"extracted_{uuid.uuid4().hex[:8]}_{file_name}"
                         )
@@ -262,6 +326,7 @@ def extract():
                         )
                     except Exception as e:
                         error_msg = f"Error decoding file: {e}"
+            record_metric("steghider_payload_bytes", payload_bytes, operation="extract")
     else:
         # It's a string (error or old format)
         if str(extracted_data).startswith("[-]"):
@@ -293,6 +358,8 @@ def generate_keys_route():
 
     generate_keys(priv_path, pub_path)
 
+    import zipfile
+
     with zipfile.ZipFile(zip_path, "w") as zipf:
         zipf.write(priv_path, arcname="private_key.pem")
         zipf.write(pub_path, arcname="public_key.pem")
@@ -313,23 +380,20 @@ def metawipe():
     if image.filename == "":
         return "No selected file", 400
 
-    # Save input image
-    ext = os.path.splitext(image.filename)[1]
-    unique_id = str(uuid.uuid4())
-    input_path = os.path.join(app.config["UPLOAD_FOLDER"], f"{unique_id}_input{ext}")
-    image.save(input_path)
-
-    output_filename = f"clean_{unique_id}{ext}"
-    output_path = os.path.join(app.config["UPLOAD_FOLDER"], output_filename)
+    image_data = image.read()
+    record_image(image_data)
+    output_filename = f"clean_{uuid.uuid4()}.png"
 
     try:
-        clean_path = metawipe_image(input_path, output_path)
-        return send_file(clean_path, as_attachment=True, download_name=output_filename)
+        clean = metawipe_image(image_data)
+        return send_file(
+            io.BytesIO(clean),
+            mimetype="image/png",
+            as_attachment=True,
+            download_name=output_filename,
+        )
     except Exception as e:
         return f"Error cleaning metadata: {str(e)}", 500
-    finally:
-        if os.path.exists(input_path):
-            os.remove(input_path)
 
 
 @app.route("/embed_nft", methods=["POST"])
@@ -346,23 +410,18 @@ def embed_nft():
         return "Missing fields", 400
 
     unique_id = str(uuid.uuid4())
-    input_path = os.path.join(app.config["UPLOAD_FOLDER"], f"{unique_id}_input.png")
-    image.save(input_path)
-    output_path = os.path.join(app.config["UPLOAD_FOLDER"], f"nft_{unique_id}.png")
-
     try:
         result = embed_nft_secret(
-            input_path, owner_wallet, faction, superpower, keys_clue, level, output_path
+            image.read(), owner_wallet, faction, superpower, keys_clue, level
         )
         return send_file(
-            output_path, as_attachment=True, download_name=f"nft_{unique_id}.png"
+            io.BytesIO(result["output"]),
+            mimetype="image/png",
+            as_attachment=True,
+            download_name=f"nft_{unique_id}.png",
         )
     except Exception as e:
         return f"Error: {e}", 500
-    finally:
-        for path in [input_path, output_path]:
-            if os.path.exists(path):
-                os.remove(path)
 
 
 @app.route("/qr/<data>")
@@ -373,7 +432,9 @@ def generate_qr(data):
     except:
         decoded_data = data
 
-    # Generate QR code
+    # Generate QR code (qrcode is only imported when a QR is requested)
+    import qrcode
+
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
     qr.add_data(decoded_data)
     qr.make(fit=True)
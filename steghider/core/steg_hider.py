@@ -1,125 +1,888 @@
-from PIL import Image
 import sys
 import os
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
-from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 import base64
 import json
+import struct
 import zlib
-import secrets
-import zipfile
 import io
-import reedsolo
+import ast
+import mmap
+import shutil
 import logging
 import random
+import functools
+import bisect
+import contextlib
+import re
+import time
+import itertools
+import threading
+import importlib
+import importlib.util
 
-logging.basicConfig(level=logging.INFO)
+# Heavy dependencies are imported on first use so that importing this module
+# (and the web apps built on it) stays cheap; see benchmarks/bench_import.py.
+# cryptography, zipfile, cProfile and the process pool are imported inside
+# the functions that need them.
+
+
+class _LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name):
+        self.__name__ = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        return getattr(self._module, attr)
+
+
+Image = _LazyModule("PIL.Image")
+
+# NumPy is optional; the reference engine needs only Pillow
+np = _LazyModule("numpy") if importlib.util.find_spec("numpy") else None
+
+# creedsolo is the compiled build of reedsolo, same API
+_rs_backend = _LazyModule(
+    "creedsolo" if importlib.util.find_spec("creedsolo") else "reedsolo"
+)
 
 DELIMITER = "###END###"
 
+PBKDF2_ITERATIONS = 100000
+
+# Payload bytes are expanded to bits (and bits packed back) this many at a
+# time, so the temporary bit and row buffers stay bounded for any payload.
+BIT_CHUNK_BYTES = 1 << 16
+
+# Container format v2: a fixed-size header slot, protected by its own
+# Reed-Solomon parity, sits in front of the payload and says exactly how many
+# bytes follow.  Images without it are read with the legacy DELIMITER scan.
+CONTAINER_MAGIC = b"STGH"
+CONTAINER_VERSION = 2
+HEADER_SIZE = 40
+HEADER_NSYM = 24
+HEADER_BLOCK_SIZE = HEADER_SIZE + HEADER_NSYM
+# The header is always stored at 1 bit per channel in the first HEADER_LANES
+# channels; the payload follows at the bits_per_channel the header declares.
+HEADER_LANES = HEADER_BLOCK_SIZE * 8
+MAX_BITS_PER_CHANNEL = 4
+
+LEVELS = ("basic", "advanced", "premium")
+FLAG_RS = 0x01
+FLAG_ALPHA = 0x02
+FLAG_INTERLEAVE = 0x04
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+KDF_NONE = 0
+KDF_PBKDF2_SHA256 = 1
+
+# level, flags, nsym, codec, kdf, kdf_iterations, payload_length
+_HEADER_FIELDS = struct.Struct(">BBBBBII")
+# Fields appended after the base layout as (name, struct format, default).
+# Headers written before a field existed are shorter and read its default.
+_HEADER_EXTENSIONS = [
+    ("bits_per_channel", "B", 1),
+    ("carrier_mode", "B", 0),
+    ("checksum_group", "H", 0),
+]
+
+# Image modes used as carriers without conversion, as (bytes per pixel,
+# colour byte offsets, alpha byte offsets).  A mode's position is its code in
+# the header.  "I;16" is little-endian, so offset 0 is the low byte of every
+# 16-bit sample.
+_CARRIER_LAYOUTS = {
+    "RGB": (3, (0, 1, 2), ()),
+    "RGBA": (4, (0, 1, 2), (3,)),
+    "L": (1, (0,), ()),
+    "LA": (2, (0,), (1,)),
+    "I;16": (2, (0,), ()),
+}
+CARRIER_MODES = tuple(_CARRIER_LAYOUTS)
+
+
+# Built codecs are kept for reuse: building one computes the Galois field
+# tables and the generator polynomial, which costs more than encoding a
+# small payload.
+RS_CODEC_CACHE_SIZE = 32
+
+
+@functools.lru_cache(maxsize=RS_CODEC_CACHE_SIZE)
+def get_rs_codec(nsym, nsize=255, fcr=0, prim=0x11D, generator=2, c_exp=8):
+    """Shared RSCodec for the given parameters (creedsolo when installed)."""
+    return _rs_backend.RSCodec(
+        nsym, nsize=nsize, fcr=fcr, prim=prim, generator=generator, c_exp=c_exp
+    )
+
+
+# Payloads of at least this many full codewords are encoded, and checked for
+# errors, a whole batch of codewords at a time with NumPy (when installed).
+RS_BATCH_MIN_CODEWORDS = 4
+RS_CODEWORD_SIZE = 255
+# Damaged codewords are corrected in a process pool of RS_WORKERS processes
+# (default: one per CPU) once there are at least this many of them.
+RS_PARALLEL_MIN_CODEWORDS = 256
+RS_WORKERS = None
+# v2 containers follow the RS payload with a CRC32 of every group of this
+# many stored codewords; groups whose CRC matches skip RS decoding.
+RS_CHECKSUM_GROUP = 16
+
+
+@functools.lru_cache(maxsize=RS_CODEC_CACHE_SIZE)
+def _rs_batch_tables(nsym):
+    """GF(2^8) log/antilog tables plus generator and syndrome log-constants.
+
+    Same field as reedsolo's defaults (prim 0x11d, generator 2, fcr 0).
+    log[0] is a sentinel whose sums always land in the zero tail of exp, so
+    exp[log[a] + log[b]] is a * b for every a and b, zero included.
+    """
+    exp = np.zeros(1024, dtype=np.uint8)
+    log = np.zeros(256, dtype=np.int32)
+    x = 1
+    for i in range(255):
+        exp[i] = exp[i + 255] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= 0x11D
+    log[0] = 511
+    gen = [1]
+    for i in range(nsym):
+        # gen *= (x - alpha^i)
+        root = int(exp[i])
+        gen = [
+            c ^ (int(exp[log[p] + log[root]]) if p else 0)
+            for c, p in zip(gen + [0], [0] + gen)
+        ]
+    return exp, log, log[np.array(gen[1:])], np.arange(nsym, dtype=np.int32)
+
+
+def _rs_encode_batch(data, nsym):
+    """rs_encode for whole codewords, vectorized across the batch.
+
+    Runs reedsolo's synthetic division as an LFSR over every codeword at
+    once: one step per message byte position, each a table lookup across
+    the (codewords x nsym) parity registers.
+    """
+    exp, log, log_gen, _ = _rs_batch_tables(nsym)
+    msg = np.frombuffer(data, dtype=np.uint8).reshape(-1, RS_CODEWORD_SIZE - nsym)
+    parity = np.zeros((msg.shape[0], nsym), dtype=np.uint8)
+    for i in range(msg.shape[1]):
+        feedback = log[msg[:, i] ^ parity[:, 0]]
+        parity[:, :-1] = parity[:, 1:]
+        parity[:, -1] = 0
+        parity ^= exp[feedback[:, None] + log_gen]
+    return np.concatenate((msg, parity), axis=1).tobytes()
+
+
+def _rs_dirty_codewords(words, nsym):
+    """Indices of the rows of a codeword array whose syndromes are not zero."""
+    exp, log, _, log_roots = _rs_batch_tables(nsym)
+    syndromes = np.zeros((words.shape[0], nsym), dtype=np.uint8)
+    for i in range(RS_CODEWORD_SIZE):
+        # Horner step for every root alpha^j at once: s = s * alpha^j + c
+        syndromes = exp[log[syndromes] + log_roots] ^ words[:, i : i + 1]
+    return np.flatnonzero(syndromes.any(axis=1))
+
 
 def rs_encode(data, nsym):
     """Encodes data with Reed-Solomon error correction."""
-    rs = reedsolo.RSCodec(nsym)
-    return rs.encode(data)
+    size = RS_CODEWORD_SIZE - nsym
+    whole = len(data) // size * size
+    if np is None or whole < RS_BATCH_MIN_CODEWORDS * size:
+        return get_rs_codec(nsym).encode(data)
+    encoded = bytearray(_rs_encode_batch(memoryview(data)[:whole], nsym))
+    if whole < len(data):
+        encoded += get_rs_codec(nsym).encode(bytearray(data[whole:]))
+    return encoded
+
+
+def _rs_correct_codewords(nsym, items):
+    """Corrects (index, codeword, erasures, missing) tuples.
+
+    Returns (index, message) pairs, with None where correction fails.  Known
+    erasures let RS fix up to nsym of them instead of nsym / 2 errors; if
+    decoding with them fails, the codeword is retried without.  missing
+    positions were never read and are always passed as erasures, so a
+    codeword missing more than nsym bytes fails rather than decoding its
+    placeholder bytes as clean.
+    """
+    codec = get_rs_codec(nsym)
+    corrected = []
+    for index, word, erasures, missing in items:
+        message = None
+        attempts = [sorted(set(erasures) | set(missing))] if erasures else []
+        for erase_pos in attempts + [missing or None]:
+            if erase_pos is not None and len(erase_pos) > nsym:
+                continue
+            try:
+                message = codec.decode(word, erase_pos=erase_pos)[0]
+                break
+            except _rs_backend.ReedSolomonError:
+                pass
+        corrected.append((index, message))
+    return corrected
 
 
-def rs_decode(data, nsym):
-    """Decodes data with Reed-Solomon error correction."""
-    rs = reedsolo.RSCodec(nsym)
+def rs_interleave(data):
+    """Stripes RS-encoded data across codewords.
+
+    Byte 0 of every codeword comes first, then byte 1 of every codeword, and
+    so on, so a run of damaged bytes in the carrier lands as a byte or two
+    in many codewords instead of wiping out a few of them.
+    """
+    data = bytes(data)
+    return b"".join(data[j::RS_CODEWORD_SIZE] for j in range(RS_CODEWORD_SIZE))
+
+
+def rs_deinterleave(data):
+    """Inverse of rs_interleave."""
+    out = bytearray(len(data))
+    at = 0
+    for j in range(RS_CODEWORD_SIZE):
+        count = len(range(j, len(data), RS_CODEWORD_SIZE))
+        out[j::RS_CODEWORD_SIZE] = data[at : at + count]
+        at += count
+    return out
+
+
+def rs_interleaved_positions(positions, length):
+    """Maps byte positions of rs_interleave output back to the encoded data."""
+    starts = []
+    at = 0
+    for j in range(RS_CODEWORD_SIZE):
+        starts.append(at)
+        at += len(range(j, length, RS_CODEWORD_SIZE))
+    mapped = []
+    for p in positions:
+        j = bisect.bisect_right(starts, p) - 1
+        mapped.append((p - starts[j]) * RS_CODEWORD_SIZE + j)
+    return sorted(mapped)
+
+
+def rs_checksums(data, group=RS_CHECKSUM_GROUP):
+    """CRC32 (big-endian) of every group of codewords in RS-encoded data."""
+    span = group * RS_CODEWORD_SIZE
+    return b"".join(
+        struct.pack(">I", zlib.crc32(memoryview(data)[start : start + span]))
+        for start in range(0, len(data), span)
+    )
+
+
+def rs_checksums_size(length, group=RS_CHECKSUM_GROUP):
+    """Size of the rs_checksums table for length bytes of RS-encoded data."""
+    return -(-length // (group * RS_CODEWORD_SIZE)) * 4
+
+
+def _pool_map(fn, jobs, workers, pool=None):
+    """list(map(fn, jobs)) across a process pool, or None if none can run.
+
+    Uses pool if given, otherwise a pool of workers processes for this call.
+    Hosts without working multiprocessing (no /dev/shm or fork, as on some
+    serverless platforms) fail to start or to feed one; callers then do
+    the work serially.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
     try:
-        decoded, _, _ = rs.decode(data)
-        return decoded
-    except reedsolo.ReedSolomonError as e:
-        logging.error(f"Reed-Solomon decoding failed: {e}")
+        if pool is not None:
+            return list(pool.map(fn, jobs))
+        with ProcessPoolExecutor(workers) as pool:
+            return list(pool.map(fn, jobs))
+    except (OSError, ImportError, NotImplementedError, BrokenProcessPool) as e:
+        logging.warning(f"Process pool unavailable ({e}); continuing serially")
         return None
 
 
-def auto_tune_parity(image_path, expected_corruption_percent):
-    """Estimates optimal parity symbols based on expected corruption."""
-    img = Image.open(image_path)
+def rs_decode_blocks(
+    data, nsym, workers=None, checksums=None, group=0, erasures=None, missing=None
+):
+    """Decodes Reed-Solomon data codeword by codeword.
+
+    Returns (decoded, failed) where failed lists the (start, end) byte
+    ranges of decoded whose codewords could not be corrected; those bytes
+    are left as received.  Clean codewords are found a batch at a time
+    (with NumPy) and copied through; damaged ones are corrected in a
+    process pool when there are at least RS_PARALLEL_MIN_CODEWORDS (or
+    serially where no pool can be started).
+
+    workers: pool size (default: RS_WORKERS, else one per CPU); 1 disables it
+    checksums, group: an rs_checksums table and its group size; groups that
+    match it are taken as clean without computing syndromes
+    erasures: function returning the sorted byte positions of data that are
+        known to be damaged (see find_erasures); only called when some
+        codeword needs correcting
+    missing: sorted byte positions of data that were never read (e.g. cut
+        off by a crop) and hold placeholders; every codeword they touch is
+        corrected with them as erasures, and listed in failed if it cannot be
+    """
+    size = RS_CODEWORD_SIZE
+    msg_size = size - nsym
+    words = memoryview(data)
+    whole = len(words) // size * size
+    count = -(-len(words) // size)
+
+    unchecked = range(count)
+    if checksums and group:
+        span = group * size
+        unchecked = [
+            i
+            for g, start in enumerate(range(0, len(words), span))
+            if zlib.crc32(words[start : start + span])
+            != int.from_bytes(checksums[g * 4 : g * 4 + 4], "big")
+            for i in range(g * group, min(count, (g + 1) * group))
+        ]
+
+    rows = [i for i in unchecked if i < whole // size]
+    if np is not None and len(rows) >= RS_BATCH_MIN_CODEWORDS:
+        grid = np.frombuffer(words[:whole], dtype=np.uint8).reshape(-1, size)
+        decoded = bytearray(grid[:, :msg_size].tobytes())
+        rows = np.asarray(rows)
+        dirty = [int(i) for i in rows[_rs_dirty_codewords(grid[rows], nsym)]]
+    else:
+        decoded = bytearray()
+        for start in range(0, whole, size):
+            decoded += words[start : start + msg_size]
+        dirty = rows
+    if whole < len(words):
+        decoded += words[whole : max(whole, len(words) - nsym)]
+        if whole // size in unchecked:
+            dirty.append(whole // size)
+    missing = missing or []
+    if missing:
+        dirty = sorted(set(dirty).union(p // size for p in missing))
+    erased = erasures() if erasures is not None and dirty else []
+
+    def local(positions, i):
+        lo = bisect.bisect_left(positions, i * size)
+        hi = bisect.bisect_left(positions, (i + 1) * size)
+        return [p - i * size for p in positions[lo:hi]]
+
+    items = [
+        (i, bytearray(words[i * size : (i + 1) * size]), local(erased, i))
+        + (local(missing, i),)
+        for i in dirty
+    ]
+
+    workers = workers or RS_WORKERS or os.cpu_count() or 1
+    parts = None
+    if workers > 1 and len(items) >= RS_PARALLEL_MIN_CODEWORDS:
+        group = -(-len(items) // (workers * 4))
+        groups = [items[i : i + group] for i in range(0, len(items), group)]
+        correct = functools.partial(_rs_correct_codewords, nsym)
+        parts = _pool_map(correct, groups, workers)
+    if parts is not None:
+        corrected = [pair for part in parts for pair in part]
+    else:
+        corrected = _rs_correct_codewords(nsym, items)
+
+    failed = []
+    for index, message in corrected:
+        start = index * msg_size
+        if message is None:
+            end = min(start + msg_size, len(decoded))
+            if failed and failed[-1][1] == start:
+                failed[-1] = (failed[-1][0], end)
+            else:
+                failed.append((start, end))
+        else:
+            decoded[start : start + len(message)] = message
+    return decoded, failed
+
+
+def rs_decode(data, nsym):
+    """Decodes data with Reed-Solomon error correction (see rs_decode_blocks).
+
+    Returns None if any codeword cannot be corrected.
+    """
+    decoded, failed = rs_decode_blocks(data, nsym)
+    if failed:
+        logging.error(
+            f"Reed-Solomon decoding failed for bytes {_format_ranges(failed)}"
+        )
+        return None
+    return decoded
+
+
+# Runs of at least this many identical pixels inside the payload are taken
+# as wiped (zeroed or flat-filled): embedded LSBs make such runs vanishingly
+# unlikely in an intact image, so their bytes are handed to RS as erasures.
+ERASURE_MIN_PIXELS = 8
+
+
+def find_erasures(img, nbytes, first_lane=0, bits=1, alpha=False):
+    """Byte positions of a payload that lie on wiped regions of the carrier.
+
+    The payload is nbytes stored from lane first_lane at bits per lane, as
+    written by the embed engines.  img may be an image, _PngRows or
+    _MappedRows; lanes are scanned a band of rows at a time.
+    """
     width, height = img.size
-    total_bytes = width * height * 3  # RGB
-    max_errors = int(expected_corruption_percent / 100 * total_bytes)
-    nsym = min(255, max(1, max_errors * 2))  # Can correct up to nsym/2 errors
+    pixel_bytes, offsets = _carrier_lanes(img.mode, alpha)
+    period = len(offsets)
+    row_lanes = width * period
+    run = re.compile(rb"(.{%d})\1{%d,}" % (period, ERASURE_MIN_PIXELS - 1), re.DOTALL)
+    nlanes = min(-(-nbytes * 8 // bits), width * height * period - first_lane)
+    keep = period * ERASURE_MIN_PIXELS
+
+    positions = []
+    carried = b""
+    for start in range(0, max(0, nlanes), _CHUNK_BYTES * 8):
+        count = min(nlanes - start, _CHUNK_BYTES * 8)
+        lane = first_lane + start
+        y0, y1 = _lane_rows(lane, count, row_lanes, height)
+        lanes = _gather_lanes(_row_bytes(img, y0, y1), pixel_bytes, offsets)
+        offset = lane - y0 * row_lanes
+        # Lanes carried over from the previous band let runs span bands
+        window = carried + bytes(lanes[offset : offset + count])
+        base = start - len(carried)
+        for match in run.finditer(window):
+            a, b = base + match.start(), base + match.end()
+            first = max(0, a * bits // 8)
+            last = min(nbytes - 1, (b * bits - 1) // 8)
+            if positions and positions[-1] >= first:
+                first = positions[-1] + 1
+            positions.extend(range(first, last + 1))
+        carried = window[-keep:]
+    return positions
+
+
+def _format_ranges(ranges):
+    return ", ".join(f"{start}-{end - 1}" for start, end in ranges)
+
+
+def build_header(
+    level,
+    payload_length,
+    enable_rs=False,
+    nsym=0,
+    codec=CODEC_ZLIB,
+    kdf=KDF_NONE,
+    kdf_iterations=0,
+    alpha=False,
+    interleave=False,
+    **extensions,
+):
+    """Builds the RS-protected v2 container header (HEADER_BLOCK_SIZE bytes).
+
+    alpha: the payload also uses the alpha lanes of the carrier
+    interleave: the RS codewords are stored interleaved (see rs_interleave)
+    extensions: values for the _HEADER_EXTENSIONS fields (defaults if omitted)
+    """
+    body = _HEADER_FIELDS.pack(
+        LEVELS.index(level),
+        (FLAG_RS if enable_rs else 0)
+        | (FLAG_ALPHA if alpha else 0)
+        | (FLAG_INTERLEAVE if interleave else 0),
+        nsym if enable_rs else 0,
+        codec,
+        kdf,
+        kdf_iterations,
+        payload_length,
+    )
+    for name, fmt, default in _HEADER_EXTENSIONS:
+        body += struct.pack(">" + fmt, extensions.pop(name, default))
+    if extensions:
+        raise TypeError(f"Unknown header fields: {sorted(extensions)}")
+    raw = CONTAINER_MAGIC + bytes([CONTAINER_VERSION, len(body)]) + body
+    raw += struct.pack(">I", zlib.crc32(raw))
+    return bytes(get_rs_codec(HEADER_NSYM).encode(raw.ljust(HEADER_SIZE, b"\0")))
+
+
+def parse_header(block):
+    """Parses a v2 container header. Returns a dict, or None if there is none."""
+    if len(block) < HEADER_BLOCK_SIZE:
+        return None
+    try:
+        raw, _, _ = get_rs_codec(HEADER_NSYM).decode(
+            bytearray(block[:HEADER_BLOCK_SIZE])
+        )
+    except _rs_backend.ReedSolomonError:
+        return None
+    raw = bytes(raw)
+    if raw[:4] != CONTAINER_MAGIC or raw[4] != CONTAINER_VERSION:
+        return None
+    body_len = raw[5]
+    crc_at = 6 + body_len
+    if body_len < _HEADER_FIELDS.size or crc_at + 4 > HEADER_SIZE:
+        return None
+    if zlib.crc32(raw[:crc_at]) != struct.unpack_from(">I", raw, crc_at)[0]:
+        return None
+
+    level, flags, nsym, codec, kdf, kdf_iterations, payload_length = (
+        _HEADER_FIELDS.unpack_from(raw, 6)
+    )
+    if level >= len(LEVELS):
+        return None
+    header = {
+        "version": raw[4],
+        "level": LEVELS[level],
+        "enable_rs": bool(flags & FLAG_RS),
+        "alpha": bool(flags & FLAG_ALPHA),
+        "interleave": bool(flags & FLAG_INTERLEAVE),
+        "nsym": nsym,
+        "codec": codec,
+        "kdf": kdf,
+        "kdf_iterations": kdf_iterations,
+        "payload_length": payload_length,
+    }
+    offset = 6 + _HEADER_FIELDS.size
+    for name, fmt, default in _HEADER_EXTENSIONS:
+        size = struct.calcsize(">" + fmt)
+        if offset + size <= crc_at:
+            (header[name],) = struct.unpack_from(">" + fmt, raw, offset)
+        else:
+            header[name] = default
+        offset += size
+    if not 1 <= header["bits_per_channel"] <= MAX_BITS_PER_CHANNEL:
+        return None
+    if header["carrier_mode"] >= len(CARRIER_MODES):
+        return None
+    return header
+
+
+# Parity auto-tuning: the smallest nsym whose payload comes back from at
+# least TUNE_TARGET of TUNE_TRIALS simulated corruptions.  Without a payload
+# the tuner uses random bytes (like an encrypted payload) filling a quarter of
+# the cover, at most TUNE_DEFAULT_PAYLOAD bytes.
+TUNE_TARGET = 0.95
+TUNE_TRIALS = 8
+TUNE_MAX_NSYM = RS_CODEWORD_SIZE - 1
+TUNE_DEFAULT_PAYLOAD = 1024
+
+
+def _rs_encoded_size(length, nsym):
+    return length + -(-length // (RS_CODEWORD_SIZE - nsym)) * nsym
+
+
+def _rs_survives(sent, received, nsym, erased):
+    """True if _rs_correct_codewords would restore sent from received.
+
+    Both are in codeword order and erased is a sorted list of erasure
+    positions.  A codeword decodes when 2 * errors + erasures <= nsym, with
+    errors counted outside the erasures (or 2 * errors <= nsym, the retry
+    without them); since the clean codewords are known this is exact and
+    needs no decoding.
+    """
+    if np is not None:
+        wrong = np.flatnonzero(
+            np.frombuffer(sent, np.uint8) != np.frombuffer(received, np.uint8)
+        ).tolist()
+    else:
+        wrong = [i for i, (a, b) in enumerate(zip(sent, received)) if a != b]
+    size = RS_CODEWORD_SIZE
+    errors = {}
+    for i in wrong:
+        errors.setdefault(i // size, []).append(i)
+    for index, positions in errors.items():
+        if 2 * len(positions) <= nsym:
+            continue
+        lo = bisect.bisect_left(erased, index * size)
+        hi = bisect.bisect_left(erased, (index + 1) * size)
+        known = set(erased[lo:hi])
+        missed = sum(p not in known for p in positions)
+        if len(known) > nsym or 2 * missed + len(known) > nsym:
+            return False
+    return True
+
+
+def _parity_recovery(job):
+    """Fraction of trials, worst model first, in which job's payload survives."""
+    img, payload, nsym, models, trials, first_lane, bits, alpha, interleave, seed = job
+    encoded = rs_encode(payload, nsym)
+    data = rs_interleave(encoded) if interleave else encoded
+    img = img.copy()
+    EMBED_ENGINES[DEFAULT_ENGINE](img, data, first_lane, bits, alpha)
+    read = READ_ENGINES[DEFAULT_ENGINE]
+    worst = 1.0
+    for name, level in models:
+        recovered = 0
+        for trial in range(trials):
+            rng = random.Random(f"{seed}:{name}:{level}:{trial}")
+            damaged = CORRUPTION_MODELS[name](img, level, rng)
+            received = read(damaged, len(data), first_lane, bits, alpha)
+            if received == data:
+                recovered += 1
+                continue
+            # A cropped carrier yields fewer bytes; the rest are erasures
+            available = len(received)
+            received = bytes(received).ljust(len(data), b"\0")
+            erased = find_erasures(damaged, len(data), first_lane, bits, alpha)
+            erased += range(available, len(data))
+            if interleave:
+                received = rs_deinterleave(received)
+                erased = rs_interleaved_positions(erased, len(data))
+            recovered += _rs_survives(encoded, received, nsym, erased)
+        worst = min(worst, recovered / trials)
+    return worst
+
+
+def _carrier_head(image, rows, mode=None):
+    """(first rows of a cover as a PIL image in mode, full height).
+
+    image is a path or an image; mapped and streamable covers are not
+    decoded past rows.
+    """
+    if isinstance(image, Image.Image):
+        height = image.height
+        head = image.crop((0, 0, image.width, min(rows, height)))
+    else:
+        source = _open_mapped(image) or _open_png_rows(image)
+        if source is None:
+            with Image.open(image) as full:
+                return _carrier_head(_carrier_image(full), rows, mode)
+        with source:
+            width, height = source.size
+            rows = min(rows, height)
+            head = Image.frombytes(source.mode, (width, rows), source.rows(0, rows))
+    mode = mode or _carrier_mode(head)
+    return (head if head.mode == mode else head.convert(mode)), height
+
+
+def auto_tune_parity(
+    image,
+    expected_corruption_percent=5,
+    *,
+    payload=None,
+    models=None,
+    target=TUNE_TARGET,
+    trials=TUNE_TRIALS,
+    first_lane=HEADER_LANES,
+    bits=1,
+    alpha=False,
+    interleave=False,
+    mode=None,
+    max_nsym=TUNE_MAX_NSYM,
+    workers=None,
+    seed=0,
+):
+    """Finds the smallest nsym that protects payload against simulated damage.
+
+    The RS-encoded payload is embedded in an in-memory copy of the rows of
+    image (a path or carrier image) that it would occupy, damaged with each
+    corruption model, read back and decoded.  nsym passes when, for every
+    model, at least target of the trials decode to payload.  Candidate
+    values are searched by bisection, splitting the range at several points
+    per round across one process pool (or in-process where no pool can be
+    started).  Returns the largest nsym that fits (with a warning) when none
+    passes.
+
+    payload: the bytes hide_message would RS-encode; None tunes for random
+        bytes sized to the cover (see TUNE_DEFAULT_PAYLOAD)
+    models: (CORRUPTION_MODELS name, level) pairs; by default LSB flips and a
+        zeroed region, each on expected_corruption_percent of the pixels
+    first_lane, bits, alpha, interleave, mode: layout of the payload, as
+        hide_message would write it
+    workers: pool size (default: RS_WORKERS, else one per CPU); 1 tunes
+        in-process
+    """
+    if models is None:
+        models = [
+            ("lsb_flip", expected_corruption_percent),
+            ("zero_region", expected_corruption_percent),
+        ]
+    head, height = _carrier_head(image, 1, mode)
+    mode = head.mode
+    lanes_per_row = head.width * len(_carrier_lanes(mode, alpha)[1])
+    if payload is None:
+        capacity = (height * lanes_per_row - first_lane) * bits // 8
+        size = max(1, min(TUNE_DEFAULT_PAYLOAD, capacity // 4))
+        payload = random.Random(seed).randbytes(size)
+
+    def rows_for(nsym):
+        size = _rs_encoded_size(len(payload), nsym)
+        size += rs_checksums_size(size, RS_CHECKSUM_GROUP)
+        return -(-(first_lane + -(-size * 8 // bits)) // lanes_per_row)
+
+    hi = min(max_nsym, RS_CODEWORD_SIZE - 1)
+    while hi > 1 and rows_for(hi) > height:
+        hi -= 1
+    if rows_for(hi) > height:
+        raise ValueError("Payload does not fit in the image even without parity")
+    carrier = _carrier_head(image, rows_for(hi), mode)[0]
+
+    workers = workers or RS_WORKERS or os.cpu_count() or 1
+    pool = None
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        try:
+            pool = ProcessPoolExecutor(workers)
+        except (OSError, ImportError, NotImplementedError) as e:
+            logging.warning(f"Process pool unavailable ({e}); tuning serially")
+    rates = {}
+
+    def evaluate(candidates):
+        nonlocal pool
+        jobs = [
+            (carrier.crop((0, 0, carrier.width, rows_for(n))), payload, n, models)
+            + (trials, first_lane, bits, alpha, interleave, seed)
+            for n in candidates
+        ]
+        results = _pool_map(_parity_recovery, jobs, workers, pool) if pool else None
+        if results is None:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+                pool = None
+            results = map(_parity_recovery, jobs)
+        rates.update(zip(candidates, results))
+
+    try:
+        evaluate([hi])
+        if rates[hi] < target:
+            logging.warning(
+                f"No parity up to nsym={hi} reaches {target:.0%} recovery "
+                f"(best {rates[hi]:.0%}); using nsym={hi}"
+            )
+            return hi
+        lo = 1
+        while lo < hi:
+            span = hi - lo
+            candidates = sorted(
+                {lo + span * (i + 1) // (workers + 1) for i in range(workers)}
+            )
+            evaluate(candidates)
+            passing = [n for n in candidates if rates[n] >= target]
+            if passing:
+                hi = passing[0]
+            failing = [n for n in candidates if n < hi and rates[n] < target]
+            if failing:
+                lo = failing[-1] + 1
+    finally:
+        if pool is not None:
+            pool.shutdown()
     logging.info(
-        f"Auto-tuned parity: {nsym} symbols for {expected_corruption_percent}% corruption"
+        f"Auto-tuned parity: nsym={hi} recovers {rates[hi]:.0%} of "
+        f"{trials} trials per model ({len(rates)} values tried)"
     )
-    return nsym
+    return hi
+
+
+def _corrupt_lsb_flip(img, percent, rng):
+    """Flips the colour LSBs of percent% of the pixels, chosen at random."""
+    pixel_bytes, offsets = _carrier_lanes(img.mode)
+    raw = bytearray(img.tobytes())
+    pixels = len(raw) // pixel_bytes
+    count = int(percent / 100 * pixels)
+    if np is not None:
+        picked = np.random.default_rng(rng.getrandbits(64)).choice(
+            pixels, count, replace=False
+        )
+        grid = np.frombuffer(raw, np.uint8).reshape(pixels, pixel_bytes)
+        grid[picked[:, None], list(offsets)] ^= 1
+    else:
+        for i in rng.sample(range(pixels), count):
+            for offset in offsets:
+                raw[i * pixel_bytes + offset] ^= 1
+    return Image.frombytes(img.mode, img.size, bytes(raw))
 
 
-def simulate_lsb_flip(image_path, flip_percent, output_path=None):
-    """Simulates LSB bit flipping corruption."""
-    img = Image.open(image_path)
-    pixels = list(img.getdata())
-    num_pixels = len(pixels)
-    num_flip = int(flip_percent / 100 * num_pixels)
-    flip_indices = random.sample(range(num_pixels), num_flip)
-    new_pixels = []
-    for i, pixel in enumerate(pixels):
-        if i in flip_indices:
-            r, g, b = pixel[:3]
-            r ^= 1
-            g ^= 1
-            b ^= 1
-            new_pixels.append((r, g, b) + pixel[3:] if len(pixel) > 3 else (r, g, b))
-        else:
-            new_pixels.append(pixel)
-    new_img = Image.new(img.mode, img.size)
-    new_img.putdata(new_pixels)
-    if output_path:
-        new_img.save(output_path)
-        logging.info(f"LSB flip simulation saved to {output_path}")
-    return new_img
+def _corrupt_zero_region(img, percent, rng):
+    """Zeroes a rectangle covering percent% of the image, placed at random.
 
+    Only the colour bands are zeroed; alpha is set opaque so the region stays
+    visible and its lanes keep a defined value.
+    """
+    scale = (percent / 100) ** 0.5
+    w = max(1, round(img.width * scale))
+    h = max(1, round(img.height * scale))
+    x = rng.randrange(img.width - w + 1)
+    y = rng.randrange(img.height - h + 1)
+    fill = tuple(255 if band == "A" else 0 for band in img.getbands())
+    img = img.copy()
+    img.paste(fill if len(fill) > 1 else 0, (x, y, x + w, y + h))
+    return img
 
-def simulate_zero_region(image_path, zero_percent, output_path=None):
-    """Simulates zeroing out regions."""
-    img = Image.open(image_path)
-    pixels = list(img.getdata())
-    num_pixels = len(pixels)
-    num_zero = int(zero_percent / 100 * num_pixels)
-    zero_indices = random.sample(range(num_pixels), num_zero)
-    new_pixels = []
-    for i, pixel in enumerate(pixels):
-        if i in zero_indices:
-            new_pixels.append((0, 0, 0) + pixel[3:] if len(pixel) > 3 else (0, 0, 0))
-        else:
-            new_pixels.append(pixel)
-    new_img = Image.new(img.mode, img.size)
-    new_img.putdata(new_pixels)
-    if output_path:
-        new_img.save(output_path)
-        logging.info(f"Zero region simulation saved to {output_path}")
-    return new_img
 
+def _corrupt_crop(img, percent, rng):
+    """Crops percent% of the rows off the bottom of img."""
+    rows = img.height - int(percent / 100 * img.height)
+    return img.crop((0, 0, img.width, max(1, rows)))
 
-def simulate_jpeg_recompress(image_path, quality=80, output_path=None):
-    """Simulates JPEG recompression."""
-    img = Image.open(image_path)
+
+def _corrupt_jpeg(img, quality, rng):
+    """JPEG-recompresses img in memory at the given quality."""
     buffer = io.BytesIO()
-    img.save(buffer, format="JPEG", quality=quality)
+    img.convert("L" if len(_CARRIER_LAYOUTS[img.mode][1]) == 1 else "RGB").save(
+        buffer, format="JPEG", quality=int(quality)
+    )
     buffer.seek(0)
-    new_img = Image.open(buffer)
-    if output_path:
-        new_img.save(output_path)
-        logging.info(f"JPEG recompress simulation saved to {output_path}")
-    return new_img
+    with Image.open(buffer) as jpeg:
+        return jpeg.convert(img.mode)
 
 
-def simulate_resize_roundtrip(image_path, scale=0.5, output_path=None):
-    """Simulates resize roundtrip."""
-    img = Image.open(image_path)
-    new_size = (int(img.width * scale), int(img.height * scale))
-    resized = img.resize(new_size, Image.LANCZOS)
-    back = resized.resize(img.size, Image.LANCZOS)
+def _corrupt_resize(img, scale, rng):
+    """Resizes img by scale and back."""
+    size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+    return img.resize(size, Image.LANCZOS).resize(img.size, Image.LANCZOS)
+
+
+# name -> model(img, level, rng) returning a damaged copy of a carrier-mode
+# image.  Levels are percentages, except jpeg quality and resize scale.
+CORRUPTION_MODELS = {
+    "lsb_flip": _corrupt_lsb_flip,
+    "zero_region": _corrupt_zero_region,
+    "crop": _corrupt_crop,
+    "jpeg": _corrupt_jpeg,
+    "resize": _corrupt_resize,
+}
+
+
+def simulate_chain(image, steps, output_path=None, seed=None):
+    """Applies (CORRUPTION_MODELS name, level) steps to an image in turn.
+
+    image is a path or a PIL image and is not modified.  Everything stays
+    in memory; the result is returned and also saved if output_path is
+    given.  seed (or a random.Random) makes the damage reproducible.
+    """
+    rng = seed if isinstance(seed, random.Random) else random.Random(seed)
+    if isinstance(image, Image.Image):
+        img = _carrier_image(image)
+    else:
+        with Image.open(image) as opened:
+            img = _carrier_image(opened)
+            img.load()
+    for name, level in steps:
+        if name not in CORRUPTION_MODELS:
+            raise ValueError(
+                f"Unknown corruption model '{name}'. "
+                f"Choose from {list(CORRUPTION_MODELS)}"
+            )
+        img = CORRUPTION_MODELS[name](img, level, rng)
     if output_path:
-        back.save(output_path)
-        logging.info(f"Resize roundtrip simulation saved to {output_path}")
-    return back
+        img.save(output_path)
+        logging.info(f"Corruption simulation saved to {output_path}")
+    return img
+
+
+def simulate_lsb_flip(image_path, flip_percent, output_path=None, seed=None):
+    """Simulates LSB bit flipping corruption (see simulate_chain)."""
+    return simulate_chain(image_path, [("lsb_flip", flip_percent)], output_path, seed)
+
+
+def simulate_zero_region(image_path, zero_percent, output_path=None, seed=None):
+    """Simulates zeroing out a region (see simulate_chain)."""
+    return simulate_chain(
+        image_path, [("zero_region", zero_percent)], output_path, seed
+    )
+
+
+def simulate_crop(image_path, crop_percent, output_path=None, seed=None):
+    """Simulates cropping rows off the bottom (see simulate_chain)."""
+    return simulate_chain(image_path, [("crop", crop_percent)], output_path, seed)
+
+
+def simulate_jpeg_recompress(image_path, quality=80, output_path=None, seed=None):
+    """Simulates JPEG recompression (see simulate_chain)."""
+    return simulate_chain(image_path, [("jpeg", quality)], output_path, seed)
+
+
+def simulate_resize_roundtrip(image_path, scale=0.5, output_path=None, seed=None):
+    """Simulates resize roundtrip (see simulate_chain)."""
+    return simulate_chain(image_path, [("resize", scale)], output_path, seed)
     """Removes metadata from an image for privacy, keeping basic info if specified."""
     img = Image.open(image_path)
     # Create a new image without metadata
@@ -142,13 +905,16 @@ def simulate_resize_roundtrip(image_path, scale=0.5, output_path=None):
     return output_path
 
 
-def derive_key(password, salt, encode=True):
+def derive_key(password, salt, encode=True, iterations=PBKDF2_ITERATIONS):
     """Derives a key from a password. Returns raw bytes by default, base64 for Fernet."""
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,
         salt=salt,
-        iterations=100000,
+        iterations=iterations,
     )
     key = kdf.derive(password.encode())
     if encode:
@@ -158,6 +924,8 @@ def derive_key(password, salt, encode=True):
 
 def encrypt_message_password(data, password):
     """Encrypts data using a password (PBKDF2 + AES-GCM). Compatible with extension."""
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
     salt = os.urandom(16)
     key = derive_key(password, salt, encode=False)  # Raw bytes for AES
     iv = os.urandom(12)  # 96-bit IV for GCM
@@ -173,33 +941,39 @@ def encrypt_message_password(data, password):
     return salt + iv + ciphertext + tag
 
 
-def decrypt_message_password(encrypted_data, password):
+def decrypt_message_password(encrypted_data, password, iterations=PBKDF2_ITERATIONS):
     """Decrypts a message using a password. Returns bytes. Supports AES-GCM and legacy Fernet."""
+    from cryptography.fernet import Fernet
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
     try:
         # Try AES-GCM first (new format)
-        salt = encrypted_data[:16]
-        iv = encrypted_data[16:28]
+        salt = bytes(encrypted_data[:16])
+        iv = bytes(encrypted_data[16:28])
         ciphertext_and_tag = encrypted_data[28:]
         if len(ciphertext_and_tag) < 16:
             raise ValueError("Data too short for AES-GCM")
         ciphertext = ciphertext_and_tag[:-16]
-        tag = ciphertext_and_tag[-16:]
+        tag = bytes(ciphertext_and_tag[-16:])
 
-        key = derive_key(password, salt, encode=False)  # Raw bytes for AES
+        key = derive_key(password, salt, encode=False, iterations=iterations)
         cipher = Cipher(algorithms.AES(key), modes.GCM(iv, tag))
         decryptor = cipher.decryptor()
         return decryptor.update(ciphertext) + decryptor.finalize()
     except Exception:
         # Fallback to Fernet (legacy format)
-        salt = encrypted_data[:16]
-        token = encrypted_data[16:]
-        key = derive_key(password, salt, encode=True)  # Base64 for Fernet
+        salt = bytes(encrypted_data[:16])
+        token = bytes(encrypted_data[16:])
+        key = derive_key(password, salt, encode=True, iterations=iterations)
         f = Fernet(key)
         return f.decrypt(token)
 
 
 def generate_keys(private_path="private_key.pem", public_path="public_key.pem"):
     """Generates a public/private key pair."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
     print("[*] Generating RSA key pair...")
     private_key = rsa.generate_private_key(
         public_exponent=65537,
@@ -231,6 +1005,10 @@ def generate_keys(private_path="private_key.pem", public_path="public_key.pem"):
 
 def encrypt_message(data, public_key_path):
     """Encrypts data using a hybrid approach (Fernet + RSA)."""
+    from cryptography.fernet import Fernet
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+
     # 1. Generate a symmetric key (Fernet)
     fernet_key = Fernet.generate_key()
     cipher_suite = Fernet(fernet_key)
@@ -259,10 +1037,14 @@ def encrypt_message(data, public_key_path):
 
 def decrypt_message(encrypted_data, private_key_path):
     """Decrypts a message using the hybrid approach. Returns bytes."""
+    from cryptography.fernet import Fernet
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+
     # 1. Split the data
     # RSA 2048 key size -> 256 bytes encrypted output
-    encrypted_key = encrypted_data[:256]
-    encrypted_message = encrypted_data[256:]
+    encrypted_key = bytes(encrypted_data[:256])
+    encrypted_message = bytes(encrypted_data[256:])
 
     # 2. Decrypt the Fernet key with RSA Private Key
     with open(private_key_path, "rb") as f:
@@ -285,28 +1067,1279 @@ def decrypt_message(encrypted_data, private_key_path):
 
 
 def data_to_bin(data):
-    """Convert string or bytes to a binary string."""
+    """Convert string or bytes to a binary string.
+
+    Compatibility shim: the embed/extract pipeline moves bytes end to end and
+    no longer builds bit strings; only the reference engines use this.
+    """
     if isinstance(data, str):
-        return "".join(format(ord(char), "08b") for char in data)
-    elif isinstance(data, (bytes, bytearray)):
-        return "".join(format(byte, "08b") for byte in data)
-    else:
+        try:
+            data = data.encode("latin-1")
+        except UnicodeEncodeError:
+            return "".join(format(ord(char), "08b") for char in data)
+    elif not isinstance(data, (bytes, bytearray, memoryview)):
         raise ValueError("Unsupported data type")
+    if not data:
+        return ""
+    return format(int.from_bytes(data, "big"), f"0{len(data) * 8}b")
 
 
 def bin_to_bytes(binary_data):
-    """Convert binary string to bytes."""
-    all_bytes = [binary_data[i : i + 8] for i in range(0, len(binary_data), 8)]
-    byte_array = bytearray()
-    for byte in all_bytes:
-        byte_array.append(int(byte, 2))
-    return bytes(byte_array)
+    """Convert binary string to bytes (compatibility shim, see data_to_bin)."""
+    whole = len(binary_data) - len(binary_data) % 8
+    out = int(binary_data[:whole], 2).to_bytes(whole // 8, "big") if whole else b""
+    if whole < len(binary_data):
+        out += bytes([int(binary_data[whole:], 2)])
+    return out
+
+
+def compress_json(obj, level=9):
+    """zlib-compresses json.dumps(obj) without building the whole JSON text.
+
+    The encoder's pieces are fed straight into a compressobj, so a large
+    base64 file payload is never held as JSON str and UTF-8 bytes at once.
+    """
+    compressor = zlib.compressobj(level)
+    out = bytearray()
+    for piece in json.JSONEncoder().iterencode(obj):
+        out += compressor.compress(piece.encode("utf-8"))
+    out += compressor.flush()
+    return bytes(out)
+
+
+def _carrier_mode(img):
+    """Mode an image is embedded in: its own if supported, else the nearest."""
+    if img.mode in _CARRIER_LAYOUTS:
+        return img.mode
+    if img.mode == "I":
+        # 16-bit greyscale PNGs open as "I" on older Pillow releases
+        return "I;16"
+    if img.mode == "1":
+        return "L"
+    if "A" in img.mode or "a" in img.mode or "transparency" in img.info:
+        return "RGBA"
+    return "RGB"
+
+
+def _carrier_image(img):
+    """Returns img in its carrier mode, converting only when it must."""
+    mode = _carrier_mode(img)
+    return img if img.mode == mode else img.convert(mode)
+
+
+def _carrier_lanes(mode, alpha=False):
+    """(bytes per pixel, byte offsets) of the lanes of a carrier mode.
+
+    Lanes are the colour bytes of every pixel, plus the alpha bytes when
+    alpha is set, in pixel order.
+    """
+    if mode not in _CARRIER_LAYOUTS:
+        raise ValueError(f"Unsupported carrier mode: {mode}")
+    pixel_bytes, colour, extra = _CARRIER_LAYOUTS[mode]
+    if alpha and not extra:
+        raise ValueError(f"{mode} images have no alpha channel")
+    return pixel_bytes, tuple(sorted(colour + extra)) if alpha else colour
+
+
+def _payload_lane(mode, alpha=False):
+    """First payload lane of a v2 container in a carrier of the given mode.
+
+    The header always takes the first HEADER_LANES colour lanes; with alpha
+    the payload starts at the first pixel the header leaves untouched.
+    """
+    if not alpha:
+        return HEADER_LANES
+    _, colour, extra = _CARRIER_LAYOUTS[mode]
+    return -(-HEADER_LANES // len(colour)) * (len(colour) + len(extra))
+
+
+def _gather_lanes(raw, pixel_bytes, offsets):
+    """Lane bytes of a run of raw pixels (raw itself if every byte is a lane)."""
+    if len(offsets) == pixel_bytes:
+        return raw
+    nlanes = len(offsets)
+    lanes = bytearray(len(raw) // pixel_bytes * nlanes)
+    for i, offset in enumerate(offsets):
+        lanes[i::nlanes] = raw[offset::pixel_bytes]
+    return lanes
+
+
+def _scatter_lanes(raw, lanes, pixel_bytes, offsets):
+    """Writes lanes from _gather_lanes back into the raw pixel bytes."""
+    if lanes is raw:
+        return
+    nlanes = len(offsets)
+    for i, offset in enumerate(offsets):
+        raw[offset::pixel_bytes] = lanes[i::nlanes]
+
+
+def _check_reference_layout(img, first_lane, bits, alpha=False):
+    if first_lane or bits != 1 or alpha:
+        raise ValueError(
+            "The reference engine only handles 1 bit per channel from the first pixel"
+        )
+    if img.mode != "RGB":
+        raise ValueError("The reference engine only handles RGB carriers")
+
+
+def _embed_reference(img, full_data, first_lane=0, bits=1, alpha=False):
+    """Reference embedder: walks every pixel through PixelAccess.
+
+    Kept as the ground truth the faster engines are checked against.
+    """
+    _check_reference_layout(img, first_lane, bits, alpha)
+    pixels = img.load()
+    binary_message = data_to_bin(full_data)
+    message_len = len(binary_message)
+    width, height = img.size
+    data_index = 0
+
+    for y in range(height):
+        for x in range(width):
+            r, g, b = pixels[x, y]
+
+            if data_index < message_len:
+                r = (r & ~1) | int(binary_message[data_index])
+                data_index += 1
+            if data_index < message_len:
+                g = (g & ~1) | int(binary_message[data_index])
+                data_index += 1
+            if data_index < message_len:
+                b = (b & ~1) | int(binary_message[data_index])
+                data_index += 1
+
+            pixels[x, y] = (r, g, b)
+            if data_index >= message_len:
+                break
+        if data_index >= message_len:
+            break
+    return img
+
+
+def _extract_reference(img):
+    """Reference extractor: reads bit by bit until the delimiter shows up.
+
+    Returns the bytes in front of the delimiter, or None if there is none.
+    """
+    pixels = img.load()
+    width, height = img.size
+
+    delimiter_bin = data_to_bin(DELIMITER.encode())
+    delimiter_len = len(delimiter_bin)
+
+    # We will collect bits and check the tail
+    collected_bits = []
+
+    for y in range(height):
+        for x in range(width):
+            r, g, b = pixels[x, y]
+
+            collected_bits.append(str(r & 1))
+            if (
+                len(collected_bits) >= delimiter_len
+                and "".join(collected_bits[-delimiter_len:]) == delimiter_bin
+            ):
+                break
+
+            collected_bits.append(str(g & 1))
+            if (
+                len(collected_bits) >= delimiter_len
+                and "".join(collected_bits[-delimiter_len:]) == delimiter_bin
+            ):
+                break
+
+            collected_bits.append(str(b & 1))
+            if (
+                len(collected_bits) >= delimiter_len
+                and "".join(collected_bits[-delimiter_len:]) == delimiter_bin
+            ):
+                break
+        else:
+            continue
+        break
+
+    full_binary = "".join(collected_bits)
+    if not full_binary.endswith(delimiter_bin):
+        return None
+    return bin_to_bytes(full_binary[:-delimiter_len])
+
+
+def _read_reference(img, nbytes, first_lane=0, bits=1, alpha=False):
+    """Reference reader: the first nbytes carried by the image, bit by bit."""
+    _check_reference_layout(img, first_lane, bits, alpha)
+    pixels = img.load()
+    width, height = img.size
+    nbits = nbytes * 8
+    collected_bits = []
+
+    for y in range(height):
+        for x in range(width):
+            for channel in pixels[x, y]:
+                collected_bits.append(str(channel & 1))
+            if len(collected_bits) >= nbits:
+                return bin_to_bytes("".join(collected_bits[:nbits]))
+
+    whole = len(collected_bits) - len(collected_bits) % 8
+    return bin_to_bytes("".join(collected_bits[:whole]))
+
+
+def _lane_rows(first_lane, nlanes, row_lanes, height):
+    """Row span (y0, y1) holding lanes [first_lane, first_lane + nlanes)."""
+    y0 = first_lane // row_lanes
+    y1 = min(height, -(-(first_lane + nlanes) // row_lanes))
+    return y0, max(y1, y0 + 1)
+
+
+def _row_bytes(img, y0, y1):
+    """Raw bytes of rows [y0, y1) of an image, _PngRows or _MappedRows."""
+    if isinstance(img, Image.Image):
+        return img.crop((0, y0, img.size[0], y1)).tobytes()
+    return img.rows(y0, y1)
+
+
+def _store_rows(img, y0, y1, raw):
+    """Writes raw rows [y0, y1) back into an image or _MappedRows."""
+    if isinstance(img, Image.Image):
+        box = (0, y0, img.size[0], y1)
+        img.paste(Image.frombytes(img.mode, (img.size[0], y1 - y0), raw), box)
+    else:
+        img.store(y0, raw)
+
+
+# Payload chunks are a multiple of 3 bytes so that every chunk holds a whole
+# number of symbols for any bits_per_channel from 1 to 4.
+_CHUNK_BYTES = BIT_CHUNK_BYTES // 3 * 3
+
 
+def _embed_rows(img, data, write_bits, first_lane=0, bits=1, alpha=False):
+    """Row-band embed driver shared by the fast engines.
 
+    Lanes (see _carrier_lanes) are handled as one flat uint8 run, e.g.
+    R, G, B, R, G, B, ... for RGB, and the payload is written as bits-wide
+    symbols, one per lane, starting at lane first_lane.  For every chunk of
+    payload the rows carrying it are cropped out, write_bits(lanes, offset,
+    chunk, bits) stores the symbols in the low bits starting at offset, and
+    the rows are pasted back in one call, so only the payload rows are ever
+    copied.
+    """
+    width, height = img.size
+    pixel_bytes, offsets = _carrier_lanes(img.mode, alpha)
+    row_lanes = width * len(offsets)
+    payload = memoryview(data)
+
+    for start in range(0, len(payload), _CHUNK_BYTES):
+        chunk = payload[start : start + _CHUNK_BYTES]
+        lane = first_lane + start * 8 // bits
+        y0, y1 = _lane_rows(lane, -(-len(chunk) * 8 // bits), row_lanes, height)
+        raw = bytearray(_row_bytes(img, y0, y1))
+        channels = _gather_lanes(raw, pixel_bytes, offsets)
+        write_bits(channels, lane - y0 * row_lanes, chunk, bits)
+        _scatter_lanes(raw, channels, pixel_bytes, offsets)
+        _store_rows(img, y0, y1, raw)
+    return img
+
+
+def _read_rows(img, nbytes, pack_bits, first_lane=0, bits=1, alpha=False):
+    """Row-band reader for nbytes stored from lane first_lane on.
+
+    Only the rows holding those bytes are decoded, a chunk at a time;
+    pack_bits(lanes, bits) packs the low bits of a run of lane bytes.
+    """
+    width, height = img.size
+    pixel_bytes, offsets = _carrier_lanes(img.mode, alpha)
+    row_lanes = width * len(offsets)
+    total_lanes = width * height * len(offsets)
+    nbytes = min(nbytes, max(0, (total_lanes - first_lane) * bits // 8))
+
+    out = bytearray()
+    for start in range(0, nbytes, _CHUNK_BYTES):
+        count = min(nbytes, start + _CHUNK_BYTES) - start
+        lane = first_lane + start * 8 // bits
+        nlanes = -(-count * 8 // bits)
+        y0, y1 = _lane_rows(lane, nlanes, row_lanes, height)
+        raw = _row_bytes(img, y0, y1)
+        channels = memoryview(_gather_lanes(raw, pixel_bytes, offsets))
+        offset = lane - y0 * row_lanes
+        out += pack_bits(channels[offset : offset + nlanes], bits)[:count]
+    return out
+
+
+# Rows in the first block are sized to hold about this many payload bytes;
+# every following block doubles, so short messages only touch the top rows.
+EXTRACT_FIRST_BLOCK_BYTES = 4096
+
+
+def _scan_rows(img, pack_bits):
+    """Legacy delimiter scan over growing row blocks.
+
+    LSB planes of each block are packed into bytes and searched for the
+    delimiter at byte level.  Decoding stops at the first block that
+    contains the end of the payload.
+    """
+    width, height = img.size
+    delimiter = DELIMITER.encode()
+    rows = max(1, -(-EXTRACT_FIRST_BLOCK_BYTES * 8 // (width * 3)))
+
+    data = bytearray()
+    pending = b""
+    y = 0
+    while y < height:
+        y_end = min(height, y + rows)
+        lanes = pending + _row_bytes(img, y, y_end)
+        whole = len(lanes) - len(lanes) % 8
+        search_from = max(0, len(data) - len(delimiter) + 1)
+        data += pack_bits(memoryview(lanes)[:whole])
+        pending = lanes[whole:]
+
+        end = data.find(delimiter, search_from)
+        if end != -1:
+            return bytes(data[:end])
+        y = y_end
+        rows *= 2
+    return None
+
+
+def _write_bits_numpy(channels, offset, chunk, bits=1):
+    """Whole-array bitwise ops over the carrier lanes."""
+    data = np.frombuffer(chunk, dtype=np.uint8)
+    mask = (1 << bits) - 1
+    if 8 % bits == 0:
+        # Symbols never straddle a byte: shift each byte into 8 // bits of them
+        shifts = np.arange(8 - bits, -1, -bits, dtype=np.uint8)
+        symbols = ((data[:, None] >> shifts) & mask).reshape(-1)
+    else:
+        stream = np.unpackbits(data)
+        stream = np.concatenate((stream, np.zeros(-stream.size % bits, np.uint8)))
+        stream = stream.reshape(-1, bits)
+        symbols = np.zeros(stream.shape[0], dtype=np.uint8)
+        for i in range(bits):
+            symbols |= stream[:, i] << (bits - 1 - i)
+    carrier = np.frombuffer(channels, dtype=np.uint8)[offset : offset + symbols.size]
+    carrier &= 0xFF ^ mask
+    carrier |= symbols
+
+
+def _pack_bits_numpy(lanes, bits=1):
+    values = np.frombuffer(lanes, dtype=np.uint8)
+    if bits == 1:
+        return np.packbits(values & 1).tobytes()
+    mask = (1 << bits) - 1
+    if 8 % bits == 0:
+        per_byte = 8 // bits
+        shifts = np.arange(8 - bits, -1, -bits, dtype=np.uint8)
+        values = values[: values.size - values.size % per_byte].reshape(-1, per_byte)
+        packed = np.zeros(values.shape[0], dtype=np.uint8)
+        for j in range(per_byte):
+            packed |= (values[:, j] & mask) << shifts[j]
+        return packed.tobytes()
+    stream = np.empty((values.size, bits), dtype=np.uint8)
+    for i in range(bits):
+        stream[:, i] = (values >> (bits - 1 - i)) & 1
+    stream = stream.reshape(-1)
+    return np.packbits(stream[: stream.size - stream.size % 8]).tobytes()
+
+
+# Stdlib engine tables: every lane byte is mapped through bytes.translate and
+# whole runs are combined as big integers, so no Python code runs per pixel.
+# Symbols are split into bit planes: plane i holds bit (bits - 1 - i).
+_BIT_RANGE = range(1, MAX_BITS_PER_CHANNEL + 1)
+_CLEAR_LOW = {
+    k: bytes(v & (0xFF ^ ((1 << k) - 1)) for v in range(256)) for k in _BIT_RANGE
+}
+_PLANE_WEIGHT = {
+    k: [bytes.maketrans(b"01", bytes([0, 1 << (k - 1 - i)])) for i in range(k)]
+    for k in _BIT_RANGE
+}
+_PLANE_ASCII = {
+    k: [bytes(0x30 | ((v >> (k - 1 - i)) & 1) for v in range(256)) for i in range(k)]
+    for k in _BIT_RANGE
+}
+
+
+def _write_bits_stdlib(channels, offset, chunk, bits=1):
+    """bytes.translate + int.from_bytes over the carrier lanes."""
+    nbits = len(chunk) * 8
+    nlanes = -(-nbits // bits)
+    stream = format(int.from_bytes(chunk, "big"), f"0{nbits}b").encode("ascii")
+    stream = stream.ljust(nlanes * bits, b"0")
+    merged = int.from_bytes(
+        channels[offset : offset + nlanes].translate(_CLEAR_LOW[bits]), "big"
+    )
+    for i in range(bits):
+        plane = stream[i::bits].translate(_PLANE_WEIGHT[bits][i])
+        merged |= int.from_bytes(plane, "big")
+    channels[offset : offset + nlanes] = merged.to_bytes(nlanes, "big")
+
+
+def _pack_bits_stdlib(lanes, bits=1):
+    nbytes = len(lanes) * bits // 8
+    if not nbytes:
+        return b""
+    lanes = bytes(lanes)
+    stream = bytearray(len(lanes) * bits)
+    for i in range(bits):
+        stream[i::bits] = lanes.translate(_PLANE_ASCII[bits][i])
+    return int(stream[: nbytes * 8], 2).to_bytes(nbytes, "big")
+
+
+def _embed_numpy(img, full_data, first_lane=0, bits=1, alpha=False):
+    """Array-backed embedder (see _embed_rows)."""
+    return _embed_rows(img, full_data, _write_bits_numpy, first_lane, bits, alpha)
+
+
+def _extract_numpy(img):
+    """Array-backed legacy extractor (see _scan_rows)."""
+    return _scan_rows(img, _pack_bits_numpy)
+
+
+def _read_numpy(img, nbytes, first_lane=0, bits=1, alpha=False):
+    """Array-backed reader (see _read_rows)."""
+    return _read_rows(img, nbytes, _pack_bits_numpy, first_lane, bits, alpha)
+
+
+def _embed_stdlib(img, full_data, first_lane=0, bits=1, alpha=False):
+    """Standard-library embedder for deployments without NumPy."""
+    return _embed_rows(img, full_data, _write_bits_stdlib, first_lane, bits, alpha)
+
+
+def _extract_stdlib(img):
+    """Standard-library legacy extractor."""
+    return _scan_rows(img, _pack_bits_stdlib)
+
+
+def _read_stdlib(img, nbytes, first_lane=0, bits=1, alpha=False):
+    """Standard-library reader."""
+    return _read_rows(img, nbytes, _pack_bits_stdlib, first_lane, bits, alpha)
+
+
+EMBED_ENGINES = {"reference": _embed_reference, "stdlib": _embed_stdlib}
+EXTRACT_ENGINES = {"reference": _extract_reference, "stdlib": _extract_stdlib}
+READ_ENGINES = {"reference": _read_reference, "stdlib": _read_stdlib}
+if np is not None:
+    EMBED_ENGINES["numpy"] = _embed_numpy
+    EXTRACT_ENGINES["numpy"] = _extract_numpy
+    READ_ENGINES["numpy"] = _read_numpy
+
+# Picked once at import: NumPy when it is installed, otherwise the stdlib
+# engine.  STEGHIDER_ENGINE overrides the choice (e.g. to pin "stdlib").
+DEFAULT_ENGINE = os.environ.get("STEGHIDER_ENGINE") or (
+    "numpy" if np is not None else "stdlib"
+)
+if DEFAULT_ENGINE not in EMBED_ENGINES:
+    raise ImportError(
+        f"STEGHIDER_ENGINE={DEFAULT_ENGINE!r} is not available; "
+        f"choose from {list(EMBED_ENGINES)}"
+    )
+
+
+# Streaming PNG carriers: covers are read and written a band of rows at a
+# time, so memory stays bounded by STREAM_BAND_BYTES whatever the image size.
+# Covers with at least STREAM_MIN_PIXELS pixels are streamed automatically;
+# extraction streams every PNG it can, since it stops after the payload rows.
+STREAM_BAND_BYTES = 1 << 22
+STREAM_MIN_PIXELS = 1 << 24
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# (bit depth, colour type) of the PNG layouts that can be streamed
+_PNG_CARRIERS = {
+    (8, 0): "L",
+    (8, 2): "RGB",
+    (8, 4): "LA",
+    (8, 6): "RGBA",
+    (16, 0): "I;16",
+}
+# Chunks a streamed stego PNG keeps from its cover: the ones that affect how
+# the pixels decode.  Text, EXIF, time stamps and other ancillary chunks are
+# dropped, as they are when the image is saved from memory.
+_PNG_KEPT_CHUNKS = frozenset(
+    (b"IHDR", b"PLTE", b"gAMA", b"cHRM", b"sRGB", b"iCCP", b"sBIT", b"pHYs", b"IEND")
+)
+
+_BIT_WRITERS = {"stdlib": _write_bits_stdlib}
+if np is not None:
+    _BIT_WRITERS["numpy"] = _write_bits_numpy
+
+
+def _png_chunk(kind, data):
+    crc = zlib.crc32(data, zlib.crc32(kind))
+    return struct.pack(">I", len(data)) + kind + bytes(data) + struct.pack(">I", crc)
+
+
+def _png_order(raw, mode):
+    """Swaps raw rows between Pillow's and PNG's byte order (16-bit only)."""
+    if mode != "I;16":
+        return raw
+    swapped = bytearray(len(raw))
+    swapped[0::2] = raw[1::2]
+    swapped[1::2] = raw[0::2]
+    return swapped
+
+
+class _PngRows:
+    """Forward-only reader of a non-interlaced PNG, a band of rows at a time.
+
+    Only the IDAT data of the rows asked for is read and inflated.  Rows are
+    unfiltered by Pillow from a small in-memory PNG holding just the band, and
+    come back in Pillow's raw layout for the carrier mode.  Raises ValueError
+    for files that cannot be streamed (palette, transparency, interlacing).
+    """
+
+    def __init__(self, path):
+        self._fp = open(path, "rb")
+        try:
+            self._read_head()
+        except Exception:
+            self._fp.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._fp.close()
+
+    def _read_head(self):
+        fp = self._fp
+        if fp.read(8) != _PNG_SIGNATURE:
+            raise ValueError("Not a PNG file")
+        self.head = bytearray(_PNG_SIGNATURE)
+        ihdr = None
+        while True:
+            length, kind = struct.unpack(">I4s", fp.read(8))
+            if kind == b"IDAT":
+                break
+            chunk = fp.read(length + 4)
+            if kind == b"IHDR":
+                ihdr = struct.unpack(">IIBBBBB", chunk[:13])
+            elif kind == b"tRNS":
+                raise ValueError("PNG transparency chunks are not streamed")
+            if kind in _PNG_KEPT_CHUNKS:
+                self.head += struct.pack(">I4s", length, kind) + chunk
+        if ihdr is None:
+            raise ValueError("PNG header chunk missing")
+        width, height, depth, colour_type, _, _, interlace = ihdr
+        if interlace or (depth, colour_type) not in _PNG_CARRIERS:
+            raise ValueError("PNG layout cannot be streamed")
+
+        self.size = (width, height)
+        self.mode = _PNG_CARRIERS[depth, colour_type]
+        self.row_bytes = width * _CARRIER_LAYOUTS[self.mode][0]
+        self._ihdr = (depth, colour_type)
+        self._idat_left = length
+        self._tail = None
+        self._inflate = zlib.decompressobj()
+        self._pending = b""
+        self._next_row = 0
+        self._prev = bytes(self.row_bytes)
+        self._band = (0, b"")
+
+    def _compressed(self):
+        """Next block of IDAT data, or b"" once the image data is exhausted."""
+        while self._idat_left == 0:
+            self._fp.read(4)
+            length, kind = struct.unpack(">I4s", self._fp.read(8))
+            if kind != b"IDAT":
+                self._tail = struct.pack(">I4s", length, kind)
+                self._idat_left = None
+            else:
+                self._idat_left = length
+        if self._idat_left is None:
+            return b""
+        block = self._fp.read(min(self._idat_left, 1 << 16))
+        self._idat_left -= len(block)
+        return block
+
+    def _filtered(self, count):
+        """The next count scanlines, still filtered (filter byte + row)."""
+        size = count * (self.row_bytes + 1)
+        out = bytearray()
+        while len(out) < size:
+            if not self._pending:
+                self._pending = self._compressed()
+                if not self._pending:
+                    raise ValueError("PNG image data ends early")
+            out += self._inflate.decompress(self._pending, size - len(out))
+            self._pending = self._inflate.unconsumed_tail
+        self._next_row += count
+        return out
+
+    def _unfilter(self, filtered, count):
+        ihdr = struct.pack(">II", self.size[0], count + 1) + bytes(self._ihdr)
+        data = zlib.compress(b"\0" + self._prev + filtered, 0)
+        png = (
+            _PNG_SIGNATURE
+            + _png_chunk(b"IHDR", ihdr + b"\0\0\0")
+            + _png_chunk(b"IDAT", data)
+            + _png_chunk(b"IEND", b"")
+        )
+        with Image.open(io.BytesIO(png)) as band:
+            if band.mode != self.mode:
+                # 16-bit greyscale decodes as "I" on older Pillow releases
+                band = band.convert(self.mode)
+            raw = band.tobytes()[self.row_bytes :]
+        self._prev = bytes(_png_order(raw[-self.row_bytes :], self.mode))
+        return raw
+
+    def rows(self, y0, y1):
+        """Raw bytes of rows [y0, y1).  y0 may not precede the last call's."""
+        start, band = self._band
+        if y0 < start:
+            raise ValueError("Streamed rows are read front to back")
+        y1 = min(y1, self.size[1])
+        band = band[(y0 - start) * self.row_bytes :]
+        while self._next_row < y1:
+            skip = self._next_row < y0
+            count = (
+                min(
+                    y0 if skip else y1,
+                    self._next_row + STREAM_BAND_BYTES // self.row_bytes + 1,
+                )
+                - self._next_row
+            )
+            raw = self._unfilter(self._filtered(count), count)
+            if not skip:
+                band += raw
+        band = band[: (y1 - y0) * self.row_bytes]
+        self._band = (y0, band)
+        return band
+
+    def remaining(self):
+        """Yields the filtered scanlines of all rows not read yet, as stored."""
+        while True:
+            if not self._pending:
+                self._pending = self._compressed()
+                if not self._pending:
+                    break
+            block = self._inflate.decompress(self._pending, BIT_CHUNK_BYTES * 16)
+            self._pending = self._inflate.unconsumed_tail
+            if block:
+                yield block
+        self._next_row = self.size[1]
+
+    def tail(self):
+        """Kept chunks after the image data (call after remaining())."""
+        tail = bytearray()
+        header = self._tail
+        while len(header) == 8:
+            length, kind = struct.unpack(">I4s", header)
+            chunk = self._fp.read(length + 4)
+            if kind in _PNG_KEPT_CHUNKS:
+                tail += header + chunk
+            if kind == b"IEND":
+                break
+            header = self._fp.read(8)
+        return bytes(tail)
+
+
+class _PngWriter:
+    """Writes a PNG with the header and trailing chunks of a _PngRows source."""
+
+    def __init__(self, fp, source, level=6):
+        self._fp = fp
+        self._source = source
+        self._deflate = zlib.compressobj(level)
+        self._idat = bytearray()
+        fp.write(source.head)
+
+    def rows(self, raw):
+        """Appends unfiltered rows in Pillow's layout (stored with filter 0)."""
+        raw = _png_order(raw, self._source.mode)
+        size = self._source.row_bytes
+        scanlines = bytearray(len(raw) // size * (size + 1))
+        for i in range(len(raw) // size):
+            at = i * (size + 1) + 1
+            scanlines[at : at + size] = raw[i * size : (i + 1) * size]
+        self.filtered(scanlines)
+
+    def filtered(self, scanlines):
+        """Appends scanlines that already carry their filter bytes."""
+        self._idat += self._deflate.compress(scanlines)
+        if len(self._idat) >= BIT_CHUNK_BYTES:
+            self._fp.write(_png_chunk(b"IDAT", self._idat))
+            self._idat = bytearray()
+
+    def close(self):
+        self._idat += self._deflate.flush()
+        self._fp.write(_png_chunk(b"IDAT", self._idat))
+        self._fp.write(self._source.tail())
+
+
+def _open_png_rows(path):
+    """A _PngRows reader for path, or None if the file cannot be streamed."""
+    try:
+        return _PngRows(path)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def _stream_embed(source, output, segments, write_bits):
+    """Streams source to a PNG at output, embedding segments on the way.
+
+    output is a path or a writable binary stream.
+
+    segments: (first_lane, data, bits, alpha) tuples, laid out exactly as
+    _embed_rows would write them.  Rows are pulled a band at a time; a row is
+    only written out once every symbol that lands in it has been stored, so
+    symbols that straddle two bands are held back with their rows.  Rows
+    past the payload keep their filtered scanlines and are copied through
+    without being decoded.
+    """
+    width, height = source.size
+    layouts = [_carrier_lanes(source.mode, alpha) for _, _, _, alpha in segments]
+    last_row = 0
+    for (first_lane, data, bits, _), (_, offsets) in zip(segments, layouts):
+        nlanes = -(-len(data) * 8 // bits)
+        row_lanes = width * len(offsets)
+        last_row = max(last_row, _lane_rows(first_lane, nlanes, row_lanes, height)[1])
+    band_rows = max(1, STREAM_BAND_BYTES // source.row_bytes)
+    written = [0] * len(segments)
+
+    if _is_path(output):
+        fp = open(output, "wb")
+    else:
+        fp = contextlib.nullcontext(output)
+    with fp as fp:
+        out = _PngWriter(fp, source)
+        y = y_read = 0
+        raw = bytearray()
+        while y_read < last_row:
+            y_end = min(last_row, y_read + band_rows)
+            raw += source.rows(y_read, y_end)
+            resume = y_end
+            for s, (first_lane, data, bits, _) in enumerate(segments):
+                pixel_bytes, offsets = layouts[s]
+                row_lanes = width * len(offsets)
+                unit = 3 if bits == 3 else 1
+                stop = max(0, (y_end * row_lanes - first_lane) * bits // 8)
+                stop = min(len(data), stop // unit * unit)
+                if stop > written[s]:
+                    lanes = _gather_lanes(raw, pixel_bytes, offsets)
+                    offset = first_lane + written[s] * 8 // bits - y * row_lanes
+                    write_bits(lanes, offset, memoryview(data)[written[s] : stop], bits)
+                    _scatter_lanes(raw, lanes, pixel_bytes, offsets)
+                    written[s] = stop
+                if stop < len(data):
+                    resume = min(resume, (first_lane + stop * 8 // bits) // row_lanes)
+            done = (resume - y) * source.row_bytes
+            out.rows(raw[:done])
+            del raw[:done]
+            y, y_read = resume, y_end
+        out.rows(raw)
+        if last_row < height:
+            # The first untouched row is filtered against the rows above it
+            out.rows(source.rows(last_row, last_row + 1))
+        for scanlines in source.remaining():
+            out.filtered(scanlines)
+        out.close()
+
+
+# Uncompressed rasters (24-bit BMP, binary PGM/PPM, NPY) are memory-mapped
+# instead of decoded: only the rows carrying the payload are read, and the
+# LSBs are written in place in the output file, so the cost of an embed
+# follows the payload size rather than the image size.
+_MAPPED_FORMATS = {
+    ".bmp": "BMP",
+    ".pgm": "PNM",
+    ".ppm": "PNM",
+    ".pnm": "PNM",
+    ".npy": "NPY",
+}
+_NPY_MODES = {1: "L", 2: "LA", 3: "RGB", 4: "RGBA"}
+
+
+def _parse_bmp(head):
+    offset, dib_size = struct.unpack_from("<II", head, 10)
+    if dib_size < 40:
+        raise ValueError("Unsupported BMP header")
+    width, height, _, bpp, compression = struct.unpack_from("<iiHHI", head, 18)
+    if bpp != 24 or compression != 0:
+        raise ValueError("Only uncompressed 24-bit BMPs are mapped")
+    # Rows are padded to 4 bytes and stored bottom-up unless height < 0
+    stride = (width * 3 + 3) & ~3
+    return "BMP", "RGB", width, abs(height), offset, stride, height > 0, "bgr"
+
+
+def _parse_pnm(head):
+    tokens = []
+    pos = 2
+    while len(tokens) < 3:
+        while head[pos : pos + 1].isspace() or head[pos : pos + 1] == b"#":
+            if head[pos : pos + 1] == b"#":
+                pos = head.index(b"\n", pos)
+            pos += 1
+        end = pos
+        while head[end : end + 1].isdigit():
+            end += 1
+        if end == pos:
+            raise ValueError("Malformed PNM header")
+        tokens.append(int(head[pos:end]))
+        pos = end
+    width, height, maxval = tokens
+    # Any other maxval would let an LSB write step past the maximum sample
+    if head[:2] == b"P6" and maxval == 255:
+        return "PNM", "RGB", width, height, pos + 1, width * 3, False, None
+    if maxval == 255:
+        return "PNM", "L", width, height, pos + 1, width, False, None
+    if maxval == 65535:
+        return "PNM", "I;16", width, height, pos + 1, width * 2, False, "be16"
+    raise ValueError("Only 8-bit PGM/PPM and 16-bit PGM files are mapped")
+
+
+def _parse_npy(head):
+    if head[6] == 1:
+        (header_len,) = struct.unpack_from("<H", head, 8)
+        start = 10
+    else:
+        (header_len,) = struct.unpack_from("<I", head, 8)
+        start = 12
+    meta = ast.literal_eval(head[start : start + header_len].decode("latin1"))
+    descr, shape = meta["descr"], meta["shape"]
+    channels = shape[2] if len(shape) == 3 else 1
+    if meta["fortran_order"] or len(shape) not in (2, 3):
+        raise ValueError("Only C-ordered 2-D or 3-D arrays are mapped")
+    height, width = shape[:2]
+    offset = start + header_len
+    if descr in ("|u1", "<u1", ">u1") and channels in _NPY_MODES:
+        mode = _NPY_MODES[channels]
+        return "NPY", mode, width, height, offset, width * channels, False, None
+    if descr in ("<u2", ">u2") and channels == 1:
+        order = "be16" if descr[0] == ">" else None
+        return "NPY", "I;16", width, height, offset, width * 2, False, order
+    raise ValueError(f"Unsupported array type {descr} {shape}")
+
+
+class _MappedRows:
+    """Row access to an uncompressed raster file through mmap.
+
+    rows() and store() use Pillow's raw layout for the carrier mode (RGB
+    order, top row first, 16-bit samples little-endian) whatever order the
+    file keeps them in.  Raises ValueError for files that cannot be mapped.
+    """
+
+    def __init__(self, path, writable=False):
+        with open(path, "r+b" if writable else "rb") as fp:
+            head = fp.read(4096)
+            if head[:2] == b"BM":
+                layout = _parse_bmp(head)
+            elif head[:2] in (b"P5", b"P6"):
+                layout = _parse_pnm(head)
+            elif head[:6] == b"\x93NUMPY":
+                layout = _parse_npy(head)
+            else:
+                raise ValueError("Not a BMP, PGM/PPM or NPY file")
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            self._map = mmap.mmap(fp.fileno(), 0, access=access)
+        self.format, self.mode, width, height = layout[:4]
+        self._offset, self._stride, self._bottom_up, self._order = layout[4:]
+        self.size = (width, height)
+        self.row_bytes = width * _CARRIER_LAYOUTS[self.mode][0]
+        if self._offset + self._stride * height > len(self._map):
+            self._map.close()
+            raise ValueError("Raster data is truncated")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if not self._map.closed:
+            self._map.close()
+
+    def _reorder(self, raw):
+        """Converts rows between the file's and Pillow's byte order."""
+        if self._order == "be16":
+            return _png_order(raw, "I;16")
+        raw = bytearray(raw)
+        if self._order == "bgr":
+            raw[0::3], raw[2::3] = raw[2::3], raw[0::3]
+        return raw
+
+    def _spans(self, y0, y1):
+        """(start, end) file offsets of rows [y0, y1), merged when contiguous."""
+        if not self._bottom_up and self._stride == self.row_bytes:
+            start = self._offset + y0 * self._stride
+            return [(start, start + (y1 - y0) * self._stride)]
+        height = self.size[1]
+        spans = []
+        for y in range(y0, y1):
+            start = self._offset + (height - 1 - y if self._bottom_up else y) * (
+                self._stride
+            )
+            spans.append((start, start + self.row_bytes))
+        return spans
+
+    def rows(self, y0, y1):
+        """Raw bytes of rows [y0, y1)."""
+        y1 = min(y1, self.size[1])
+        raw = bytearray()
+        for start, end in self._spans(y0, y1):
+            raw += self._map[start:end]
+        return self._reorder(raw)
+
+    def store(self, y0, raw):
+        """Writes rows from y0 on back into the file."""
+        raw = memoryview(self._reorder(raw))
+        at = 0
+        for start, end in self._spans(y0, y0 + len(raw) // self.row_bytes):
+            self._map[start:end] = raw[at : at + end - start]
+            at += end - start
+
+
+def _open_mapped(path):
+    """A read-only _MappedRows for path, or None if it cannot be mapped."""
+    try:
+        return _MappedRows(path)
+    except (OSError, ValueError, SyntaxError, LookupError, TypeError, struct.error):
+        return None
+
+
+# In-memory images: hide_message, extract_message, calculate_capacity and
+# metawipe_image take a path, the encoded file as bytes or a binary file
+# object, a PIL image, or an array (anything with __array_interface__).
+# Only paths are streamed or memory-mapped; everything else is decoded by
+# Pillow.  Their output is a path, a writable binary stream (written as PNG),
+# or None to get the PNG back as bytes, so nothing has to touch the disk.
+
+
+def _is_path(obj):
+    return isinstance(obj, (str, os.PathLike))
+
+
+def _as_image(source):
+    """source if it is a path or PIL image, otherwise a PIL image of it."""
+    if _is_path(source) or isinstance(source, Image.Image):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    if hasattr(source, "read"):
+        return Image.open(source)
+    if hasattr(source, "__array_interface__"):
+        return Image.fromarray(source)
+    raise TypeError(
+        "Expected a path, bytes, a binary file object, a PIL image or an array, "
+        f"got {type(source).__name__}"
+    )
+
+
+def _open_image(source):
+    """A PIL image of a path or of what _as_image returned."""
+    return source if isinstance(source, Image.Image) else Image.open(source)
+
+
+def _save_image(img, output):
+    """Saves img to a path (format from the extension) or as PNG to a stream.
+
+    Returns output, or the PNG bytes when output is None.
+    """
+    if _is_path(output):
+        img.save(output)
+        return output
+    buffer = io.BytesIO() if output is None else output
+    img.save(buffer, format="PNG")
+    return output if output is not None else buffer.getvalue()
+
+
+# Callbacks hook(operation, stage, seconds) told about every pipeline stage
+# of hide_message ("hide") and extract_message ("extract") as it finishes.
+STAGE_HOOKS = []
+
+
+def add_stage_hook(hook):
+    """Registers a stage timing hook (see STAGE_HOOKS); returns it."""
+    STAGE_HOOKS.append(hook)
+    return hook
+
+
+def remove_stage_hook(hook):
+    """Unregisters a hook added with add_stage_hook."""
+    STAGE_HOOKS.remove(hook)
+
+
+class StageTimings:
+    """Seconds spent in each stage of one hide_message/extract_message call.
+
+    Pass an instance as stats= and read stages (stage name -> seconds, in
+    the order the stages ran) and total afterwards.
+    """
+
+    def __init__(self):
+        self.operation = None
+        self.stages = {}
+
+    @property
+    def total(self):
+        return sum(self.stages.values())
+
+    def __repr__(self):
+        stages = ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in self.stages.items())
+        return f"StageTimings({self.operation}: {stages})"
+
+
+class _StageTimer:
+    """Splits the time since it was made into stages, one lap() per stage."""
+
+    def __init__(self, operation, stats):
+        self.operation = operation
+        self.stats = stats
+        if stats is not None:
+            stats.operation = operation
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        seconds = time.perf_counter() - self.last
+        if self.stats is not None:
+            stages = self.stats.stages
+            stages[stage] = stages.get(stage, 0.0) + seconds
+        for hook in STAGE_HOOKS:
+            try:
+                hook(self.operation, stage, seconds)
+            except Exception as e:
+                logging.warning(f"Stage hook {hook!r} failed: {e}")
+        self.last = time.perf_counter()
+
+
+def _stage_timer(operation, stats):
+    """A _StageTimer, or None when nothing listens (callers check first)."""
+    if stats is None and not STAGE_HOOKS:
+        return None
+    return _StageTimer(operation, stats)
+
+
+# Operational metrics, kept in process memory and rendered in the Prometheus
+# text format by render_metrics() (the web apps serve it at /metrics).
+# name -> (type, help, histogram buckets).  Nothing is recorded for the core
+# stages until enable_metrics() is called.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (1 << 10, 1 << 14, 1 << 17, 1 << 20, 1 << 22, 1 << 24, 1 << 26)
+MEGAPIXEL_BUCKETS = (0.1, 0.5, 1, 2, 4, 8, 16, 32, 64)
+METRICS = {
+    "steghider_http_requests_total": ("counter", "HTTP requests served", None),
+    "steghider_http_request_duration_seconds": (
+        "histogram",
+        "HTTP request latency",
+        LATENCY_BUCKETS,
+    ),
+    "steghider_http_uploaded_bytes_total": (
+        "counter",
+        "Request body bytes received",
+        None,
+    ),
+    "steghider_payload_bytes": (
+        "histogram",
+        "Size of hidden or extracted payloads",
+        BYTES_BUCKETS,
+    ),
+    "steghider_image_megapixels": (
+        "histogram",
+        "Size of processed images",
+        MEGAPIXEL_BUCKETS,
+    ),
+    "steghider_stage_duration_seconds": (
+        "histogram",
+        "Time spent in each hide/extract pipeline stage",
+        LATENCY_BUCKETS,
+    ),
+}
+_metric_values = {}
+_metrics_lock = threading.Lock()
+
+
+def record_metric(name, value=1, **labels):
+    """Adds value to a counter, or observes it in a histogram, of METRICS."""
+    kind, _, buckets = METRICS[name]
+    key = (name, tuple(sorted(labels.items())))
+    with _metrics_lock:
+        if kind == "counter":
+            _metric_values[key] = _metric_values.get(key, 0) + value
+            return
+        sample = _metric_values.get(key)
+        if sample is None:
+            # per-bucket counts, then sum and count
+            sample = _metric_values[key] = [0] * len(buckets) + [0.0, 0]
+        bucket = bisect.bisect_left(buckets, value)
+        if bucket < len(buckets):
+            sample[bucket] += 1
+        sample[-2] += value
+        sample[-1] += 1
+
+
+def _metric_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    escape = {ord("\\"): "\\\\", ord('"'): '\\"', ord("\n"): "\\n"}
+    return "{" + ",".join(f'{k}="{str(v).translate(escape)}"' for k, v in pairs) + "}"
+
+
+def render_metrics():
+    """All recorded METRICS in the Prometheus text exposition format."""
+    with _metrics_lock:
+        values = {
+            key: list(v) if isinstance(v, list) else v
+            for key, v in _metric_values.items()
+        }
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (metric, labels), value in sorted(values.items()):
+            if metric != name:
+                continue
+            if kind == "counter":
+                lines.append(f"{name}{_metric_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, value):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{_metric_labels(labels, le=bound)} {cumulative}"
+                )
+            lines.append(
+                f'{name}_bucket{_metric_labels(labels, le="+Inf")} {value[-1]}'
+            )
+            lines.append(f"{name}_sum{_metric_labels(labels)} {value[-2]}")
+            lines.append(f"{name}_count{_metric_labels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def _record_stage(operation, stage, seconds):
+    record_metric(
+        "steghider_stage_duration_seconds", seconds, operation=operation, stage=stage
+    )
+
+
+def enable_metrics():
+    """Starts recording hide/extract stage timings for render_metrics()."""
+    if _record_stage not in STAGE_HOOKS:
+        add_stage_hook(_record_stage)
+
+
+# Profiling: a call to hide_message/extract_message runs under cProfile with
+# probability STEGHIDER_PROFILE (0-1, e.g. 0.01 for 1% of live requests), or
+# when called with profile=True.  Each profiled call writes <name>.pstats and
+# <name>.collapsed (flamegraph.pl / speedscope input, in microseconds) to
+# STEGHIDER_PROFILE_DIR.
+PROFILE_RATE = float(os.environ.get("STEGHIDER_PROFILE") or 0)
+PROFILE_DIR = os.environ.get("STEGHIDER_PROFILE_DIR") or "profiles"
+_profile_rng = random.Random()
+_profile_ids = itertools.count()
+
+# Bounds on the collapsed-stack fold, which runs inside the profiled call:
+# branches worth less than COLLAPSE_MIN_SECONDS, deeper than
+# COLLAPSE_MAX_DEPTH or past COLLAPSE_MAX_PATHS are charged to their caller.
+COLLAPSE_MIN_SECONDS = 1e-6
+COLLAPSE_MAX_DEPTH = 64
+COLLAPSE_MAX_PATHS = 20000
+
+
+def _collapsed_stacks(stats):
+    """Folds cProfile stats into "root;caller;callee microseconds" lines.
+
+    cProfile records caller/callee edges rather than whole stacks, so each
+    function's time is split across the paths that reach it in proportion
+    to the time spent along each edge.  The number of such paths grows
+    exponentially with the call graph, so the walk is bounded (see
+    COLLAPSE_MAX_PATHS); time below a cut-off is charged to the caller
+    rather than dropped.
+    """
+    entries = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    def label(func):
+        filename, line, name = func
+        if filename == "~":
+            return name
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    folded = {}
+    budget = [COLLAPSE_MAX_PATHS]
+
+    def walk(func, share, path):
+        _, _, own, total, _ = entries[func]
+        path = path + (label(func),)
+        budget[0] -= 1
+        if budget[0] <= 0 or len(path) >= COLLAPSE_MAX_DEPTH:
+            folded[path] = folded.get(path, 0) + total * share
+            return
+        seconds = own * share
+        for callee, edge_total in callees.get(func, ()):
+            callee_total = entries[callee][3]
+            if callee_total <= 0 or label(callee) in path:
+                continue
+            callee_share = share * edge_total / callee_total
+            if callee_total * callee_share < COLLAPSE_MIN_SECONDS or budget[0] <= 0:
+                seconds += callee_total * callee_share
+            else:
+                walk(callee, callee_share, path)
+        folded[path] = folded.get(path, 0) + seconds
+
+    for func, (_, _, _, _, callers) in entries.items():
+        if not callers:
+            walk(func, 1.0, ())
+    return [
+        f"{';'.join(path)} {round(seconds * 1e6)}"
+        for path, seconds in folded.items()
+        if seconds * 1e6 >= 1
+    ]
+
+
+def _profiled(fn):
+    """Adds a profile= flag to fn (see PROFILE_RATE).
+
+    profile=True always profiles the call, False never does, and None (the
+    default) samples at PROFILE_RATE.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, profile=None, **kwargs):
+        if profile is None:
+            profile = PROFILE_RATE > 0 and _profile_rng.random() < PROFILE_RATE
+        if not profile:
+            return fn(*args, **kwargs)
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is active
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            name = (
+                f"{fn.__name__}-{time.strftime('%Y%m%d-%H%M%S')}"
+                f"-{os.getpid()}-{next(_profile_ids)}"
+            )
+            path = os.path.join(PROFILE_DIR, name)
+            try:
+                import pstats
+
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                stats = pstats.Stats(profiler)
+                stats.dump_stats(path + ".pstats")
+                with open(path + ".collapsed", "w") as f:
+                    f.write("\n".join(_collapsed_stacks(stats)) + "\n")
+                logging.info(f"Profile written to {path}.pstats and .collapsed")
+            except Exception as e:  # never fail the profiled call
+                logging.warning(f"Could not write profile {path}: {e}")
+
+    return wrapper
+
+
+@_profiled
 def hide_message(
     image_path,
     secret_message,
-    output_path,
+    output_path=None,
     public_key_path=None,
     password=None,
     level="basic",
@@ -315,9 +2348,24 @@ def hide_message(
     nsym=10,
     auto_tune=False,
     expected_corruption=5,
+    engine=None,
+    container_version=CONTAINER_VERSION,
+    bits_per_channel=1,
+    use_alpha=False,
+    streaming=None,
+    memory_map=None,
+    interleave=False,
+    workers=None,
+    stats=None,
 ):
     """Embeds a secret message into an image using LSB steganography.
 
+    image_path: The cover, as a path, bytes or a binary file object holding
+        the encoded image, a PIL image (left unmodified) or an array.
+    output_path: Where the stego image goes: a path (format from the
+        extension), a writable binary stream (PNG), or None to get the PNG
+        bytes back as the result's "output".
+
     Levels:
     - basic: No encryption, just compression
     - advanced: Password encryption
@@ -326,12 +2374,65 @@ def hide_message(
     Robustness options:
     - enable_rs: Enable Reed-Solomon error correction
     - nsym: Number of parity symbols (if auto_tune, this is ignored)
-    - auto_tune: Automatically estimate nsym based on expected_corruption
+    - auto_tune: Pick the smallest nsym that survives simulated corruption
+      of the prepared payload (see auto_tune_parity); v2 stores it in the
+      header
     - expected_corruption: Expected corruption percentage (0-100)
+    - interleave: Stripe RS codewords across the image (v2 only), so wiped
+      or cropped regions spread over many codewords
+    - workers: Process pool size for auto_tune (see auto_tune_parity); 1
+      tunes in-process
 
     max_file_size: Maximum file size in bytes (default 10MB)
+    engine: Embedding engine name from EMBED_ENGINES (default: DEFAULT_ENGINE)
+    container_version: 2 writes the length-prefixed header (default),
+        1 writes the legacy DELIMITER-terminated layout
+    bits_per_channel: Payload bits stored in each colour channel (1-4). The
+        value is recorded in the header, so extraction picks it up by itself.
+    use_alpha: Also store payload bits in the alpha channel (RGBA/LA covers).
+    streaming: Stream a PNG cover path to a PNG output a band of rows at a
+        time, with memory bounded by STREAM_BAND_BYTES.  None (default)
+        streams covers of at least STREAM_MIN_PIXELS pixels when possible.
+    memory_map: Memory-map an uncompressed cover (24-bit BMP, PGM/PPM, NPY)
+        and write the payload LSBs in place in output_path, which is a copy
+        of the cover (or the cover itself if the paths are the same).  None
+        (default) does this whenever the output has the cover's format.
+    stats: A StageTimings to fill with the time spent opening the cover,
+        building the payload, compressing, encrypting, tuning parity, RS
+        encoding (or just the header), embedding and saving.  Streamed
+        covers are encoded as they are embedded, so "embed" includes it.
+        STAGE_HOOKS are called either way.
+    profile: Run the call under cProfile (see PROFILE_RATE); None samples
+        at the STEGHIDER_PROFILE rate.
+
+    RGB, RGBA, L, LA and 16-bit greyscale covers are embedded in their own
+    mode, so the output keeps the cover's channels and bit depth; other
+    modes are converted to the nearest of these.  The reference engine and
+    v1 containers always work on RGB.
     """
     logging.info(f"Starting hide_message with level: {level}, enable_rs: {enable_rs}")
+    if engine is None:
+        engine = DEFAULT_ENGINE
+    if engine not in EMBED_ENGINES:
+        raise ValueError(
+            f"Unknown engine '{engine}'. Choose from {list(EMBED_ENGINES)}"
+        )
+    if container_version not in (1, CONTAINER_VERSION):
+        raise ValueError(f"Unsupported container version: {container_version}")
+    if not 1 <= bits_per_channel <= MAX_BITS_PER_CHANNEL:
+        raise ValueError(
+            f"bits_per_channel must be between 1 and {MAX_BITS_PER_CHANNEL}"
+        )
+    if bits_per_channel != 1 and (container_version == 1 or engine == "reference"):
+        raise ValueError(
+            "bits_per_channel > 1 needs a v2 container and a non-reference engine"
+        )
+    if use_alpha and (container_version == 1 or engine == "reference"):
+        raise ValueError("use_alpha needs a v2 container and a non-reference engine")
+    if streaming and (container_version == 1 or engine == "reference"):
+        raise ValueError("streaming needs a v2 container and a non-reference engine")
+    if memory_map and (container_version == 1 or engine == "reference"):
+        raise ValueError("memory_map needs a v2 container and a non-reference engine")
     if level not in ["basic", "advanced", "premium"]:
         raise ValueError("Level must be 'basic', 'advanced', or 'premium'")
 
@@ -341,100 +2442,235 @@ def hide_message(
         raise ValueError("Public key required for premium level")
 
     # Check file size if it's a file
+    file_data = None
     if isinstance(secret_message, dict) and secret_message.get("type") == "file":
         file_data = base64.b64decode(secret_message["data"])
         if len(file_data) > max_file_size:
             raise ValueError(f"File too large. Max size: {max_file_size} bytes")
 
+    timer = _stage_timer("hide", stats)
+    source = mapped = writable = None
     try:
-        img = Image.open(image_path)
-        img = img.convert("RGB")
-        pixels = img.load()
+        # PIL images and arrays belong to the caller and must not be written to
+        borrowed = hasattr(image_path, "__array_interface__")
+        image_path = _as_image(image_path)
+        output = io.BytesIO() if output_path is None else output_path
+        if memory_map is not False and container_version != 1 and engine != "reference":
+            if _is_path(image_path) and _is_path(output_path):
+                mapped = _open_mapped(image_path)
+            suffix = os.path.splitext(str(output_path))[1].lower()
+            if mapped is not None and _MAPPED_FORMATS.get(suffix) != mapped.format:
+                mapped.close()
+                mapped = None
+            if memory_map and mapped is None:
+                raise ValueError(
+                    "memory_map needs a 24-bit BMP, 8/16-bit PGM/PPM or NPY "
+                    "cover path and an output path of the same format"
+                )
+        if (
+            mapped is None
+            and streaming is not False
+            and container_version != 1
+            and engine != "reference"
+        ):
+            if _is_path(image_path):
+                source = _open_png_rows(image_path)
+            if source is not None and not streaming:
+                width, height = source.size
+                if width * height < STREAM_MIN_PIXELS:
+                    source.close()
+                    source = None
+            if (
+                source is not None
+                and _is_path(output_path)
+                and (
+                    not str(output_path).lower().endswith(".png")
+                    or os.path.abspath(output_path) == os.path.abspath(image_path)
+                )
+            ):
+                source.close()
+                source = None
+            if streaming and source is None:
+                raise ValueError(
+                    "Streaming needs a non-interlaced, non-palette PNG cover path "
+                    "and a separate .png output path or a stream"
+                )
+        if mapped is not None:
+            img = mapped
+        elif source is not None:
+            img = source
+        elif container_version == 1 or engine == "reference":
+            img = _open_image(image_path).convert("RGB")
+        else:
+            img = _carrier_image(_open_image(image_path))
+            if borrowed and img is image_path:
+                img = img.copy()
+        if use_alpha and not _CARRIER_LAYOUTS[img.mode][2]:
+            raise ValueError(
+                f"use_alpha needs a cover with an alpha channel, got {img.mode}"
+            )
+        if timer:
+            timer.lap("open")
 
         # Prepare the payload
         if isinstance(secret_message, dict):
             # It's already a structured payload (e.g. file)
             if secret_message.get("type") == "file":
-                # Auto-zip the file data
-                file_data = base64.b64decode(secret_message["data"])
+                # Auto-zip the file data (already decoded by the size check)
+                import zipfile
+
                 zip_buffer = io.BytesIO()
                 with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
                     zip_file.writestr(secret_message["name"], file_data)
+                file_data = None
                 secret_message["data"] = base64.b64encode(
-                    zip_buffer.getvalue()
+                    zip_buffer.getbuffer()
                 ).decode()
+                zip_buffer = None
                 secret_message["zipped"] = True
-            payload_str = json.dumps(secret_message)
+            payload = secret_message
         else:
             # It's just text
             payload = {"type": "text", "data": secret_message}
-            payload_str = json.dumps(payload)
+
+        if timer:
+            timer.lap("payload")
 
         # Compress the payload
         logging.info("Compressing data...")
-        payload_bytes = payload_str.encode("utf-8")
-        compressed_data = zlib.compress(payload_bytes, level=9)
+        compressed_data = compress_json(payload)
+        if timer:
+            timer.lap("compress")
 
+        kdf = KDF_NONE
         if level == "advanced":
             logging.info("Encrypting message with password (advanced)...")
             secret_data = encrypt_message_password(compressed_data, password)
-            full_data = secret_data + DELIMITER.encode()
+            kdf = KDF_PBKDF2_SHA256
         elif level == "premium":
             logging.info(f"Encrypting message with {public_key_path} (premium)...")
             # Encrypt the message -> returns bytes
             secret_data = encrypt_message(compressed_data, public_key_path)
-            # We need to append a delimiter. Since we are working with bytes now,
-            # and Fernet output is base64 (safe chars), we can use the string delimiter.
-            # But we need to be careful. Let's just append the delimiter as bytes.
-            full_data = secret_data + DELIMITER.encode()
         else:
             # Basic: Plain text mode (compressed)
             logging.info("Using basic level (no encryption)...")
-            full_data = compressed_data + DELIMITER.encode()
-
-        # Apply Reed-Solomon if enabled
-        if enable_rs:
-            if auto_tune:
-                nsym = auto_tune_parity(image_path, expected_corruption)
-            logging.info(f"Encoding with Reed-Solomon, nsym={nsym}")
-            full_data = rs_encode(full_data, nsym)
-
-        binary_message = data_to_bin(full_data)
-        message_len = len(binary_message)
+            secret_data = compressed_data
+        if timer:
+            timer.lap("encrypt")
+
+        if enable_rs and auto_tune:
+            logging.info("Auto-tuning Reed-Solomon parity...")
+            if container_version == 1:
+                nsym = auto_tune_parity(
+                    image_path,
+                    expected_corruption,
+                    payload=secret_data + DELIMITER.encode(),
+                    first_lane=0,
+                    mode=img.mode,
+                    workers=workers,
+                )
+            else:
+                nsym = auto_tune_parity(
+                    image_path,
+                    expected_corruption,
+                    payload=secret_data,
+                    first_lane=_payload_lane(img.mode, use_alpha),
+                    bits=bits_per_channel,
+                    alpha=use_alpha,
+                    interleave=interleave,
+                    mode=img.mode,
+                    workers=workers,
+                )
+            if timer:
+                timer.lap("tune")
+
+        if container_version == 1:
+            # Legacy layout: payload + DELIMITER, RS applied over both
+            full_data = secret_data + DELIMITER.encode()
+            if enable_rs:
+                logging.info(f"Encoding with Reed-Solomon, nsym={nsym}")
+                full_data = rs_encode(full_data, nsym)
+        else:
+            checksum_group = 0
+            interleave = interleave and enable_rs
+            if enable_rs:
+                logging.info(f"Encoding with Reed-Solomon, nsym={nsym}")
+                secret_data = rs_encode(secret_data, nsym)
+                checksum_group = RS_CHECKSUM_GROUP
+                checksums = rs_checksums(secret_data, checksum_group)
+                if interleave:
+                    secret_data = rs_interleave(secret_data)
+            header = build_header(
+                level,
+                len(secret_data),
+                enable_rs=enable_rs,
+                nsym=nsym,
+                codec=CODEC_ZLIB,
+                kdf=kdf,
+                kdf_iterations=PBKDF2_ITERATIONS if kdf == KDF_PBKDF2_SHA256 else 0,
+                bits_per_channel=bits_per_channel,
+                alpha=use_alpha,
+                interleave=interleave,
+                carrier_mode=CARRIER_MODES.index(img.mode),
+                checksum_group=checksum_group,
+            )
+            if checksum_group:
+                secret_data = bytearray(secret_data)
+                secret_data += checksums
+        if timer:
+            timer.lap("rs" if enable_rs else "header")
 
         width, height = img.size
-        total_pixels = width * height * 3
+        total_lanes = width * height * len(_carrier_lanes(img.mode, use_alpha)[1])
+        if container_version == 1:
+            message_len = len(full_data) * 8
+            available = total_lanes
+        else:
+            first_lane = _payload_lane(img.mode, use_alpha)
+            message_len = HEADER_LANES + len(secret_data) * 8
+            available = HEADER_LANES + (total_lanes - first_lane) * bits_per_channel
 
-        if message_len > total_pixels:
+        if message_len > available:
             raise ValueError(
-                f"Message is too large for this image. Need {message_len} bits, but image only has {total_pixels} bits available. Try a larger image or smaller file."
+                f"Message is too large for this image. Need {message_len} bits, but image only has {available} bits available. Try a larger image or smaller file."
             )
 
-        data_index = 0
-        logging.info("Embedding data...")
-
-        for y in range(height):
-            for x in range(width):
-                r, g, b = pixels[x, y]
-
-                if data_index < message_len:
-                    r = (r & ~1) | int(binary_message[data_index])
-                    data_index += 1
-                if data_index < message_len:
-                    g = (g & ~1) | int(binary_message[data_index])
-                    data_index += 1
-                if data_index < message_len:
-                    b = (b & ~1) | int(binary_message[data_index])
-                    data_index += 1
-
-                pixels[x, y] = (r, g, b)
-                if data_index >= message_len:
-                    break
-            if data_index >= message_len:
-                break
-
-        img.save(output_path)
-        logging.info(f"Data hidden successfully! Saved to {output_path}")
+        logging.info(f"Embedding data ({engine} engine)...")
+        embed = EMBED_ENGINES[engine]
+        if mapped is not None:
+            logging.info("Writing into a memory-mapped copy of the cover...")
+            mapped.close()
+            if os.path.abspath(output_path) != os.path.abspath(image_path):
+                shutil.copyfile(image_path, output_path)
+            img = writable = _MappedRows(output_path, writable=True)
+        if source is not None:
+            logging.info("Streaming the cover in row bands...")
+            segments = [(0, header, 1, False)]
+            segments.append((first_lane, secret_data, bits_per_channel, use_alpha))
+            _stream_embed(source, output, segments, _BIT_WRITERS[engine])
+        elif container_version == 1:
+            embed(img, full_data)
+        elif bits_per_channel == 1 and not use_alpha:
+            full_data = bytearray(header)
+            full_data += secret_data
+            embed(img, full_data)
+        else:
+            embed(img, header)
+            embed(img, secret_data, first_lane, bits_per_channel, use_alpha)
+        if timer:
+            timer.lap("embed")
+
+        if writable is not None:
+            writable.close()
+        elif source is None:
+            _save_image(img, output)
+        if timer:
+            timer.lap("save")
+        if output_path is None:
+            output_path = output.getvalue()
+            logging.info(f"Data hidden successfully! {len(output_path)} byte PNG")
+        else:
+            logging.info(f"Data hidden successfully! Saved to {output_path}")
 
         # Gamification score
         score = 10 if level == "basic" else 20 if level == "advanced" else 30
@@ -448,87 +2684,225 @@ def hide_message(
     except Exception as e:
         logging.error(f"Error in hide_message: {e}")
         raise
+    finally:
+        # Also on errors: each of these holds a file descriptor or a mapping
+        for handle in (mapped, writable, source):
+            if handle is not None:
+                handle.close()
 
 
+@_profiled
 def extract_message(
-    image_path, private_key_path=None, password=None, enable_rs=False, nsym=10
+    image_path,
+    private_key_path=None,
+    password=None,
+    enable_rs=False,
+    nsym=10,
+    engine=None,
+    streaming=None,
+    memory_map=None,
+    stats=None,
+    workers=None,
 ):
     """Extracts a hidden message from an image.
 
+    v2 containers carry their own RS settings in the header; enable_rs and
+    nsym are only used for legacy (DELIMITER-terminated) images.
+
+    image_path: A path, bytes or a binary file object holding the encoded
+        image, a PIL image or an array (see hide_message).
+
     enable_rs: If Reed-Solomon was used during hiding
     nsym: Number of parity symbols used
+    engine: Extraction engine name from EXTRACT_ENGINES (default: DEFAULT_ENGINE)
+    streaming: Decode a PNG path a band of rows at a time and stop reading the
+        file once the rows holding the header-declared payload are in, so
+        small messages in huge images cost about the same as in small ones.
+        None (default) does this for every PNG that can be streamed.
+    memory_map: Read uncompressed image files (24-bit BMP, PGM/PPM, NPY)
+        through mmap, touching only the payload rows.  None (default) maps them
+        whenever possible.
+    stats: A StageTimings to fill with the time spent opening the image,
+        reading the payload bits, RS decoding, decrypting, decompressing
+        and parsing (see hide_message).
+    workers: Process pool size for RS decoding (see rs_decode_blocks); 1
+        decodes in-process
+    profile: As for hide_message.
     """
     logging.info(f"Starting extract_message, enable_rs: {enable_rs}, nsym: {nsym}")
+    if engine is None:
+        engine = DEFAULT_ENGINE
+    if engine not in EXTRACT_ENGINES:
+        raise ValueError(
+            f"Unknown engine '{engine}'. Choose from {list(EXTRACT_ENGINES)}"
+        )
+    if streaming and engine == "reference":
+        raise ValueError("The reference engine cannot stream")
+    source = None
+    timer = _stage_timer("extract", stats)
     try:
-        img = Image.open(image_path)
-        img = img.convert("RGB")
-        pixels = img.load()
-
-        width, height = img.size
-        binary_data = ""
-
-        logging.info("Extracting data...")
-
-        # We need to read enough bits to find the delimiter.
-        # Since we don't know the length, we have to scan.
-        # Optimization: Check for delimiter every N bytes.
-
-        delimiter_bin = data_to_bin(DELIMITER.encode())
-        delimiter_len = len(delimiter_bin)
-
-        # We will collect bits and check the tail
-        collected_bits = []
-
-        for y in range(height):
-            for x in range(width):
-                r, g, b = pixels[x, y]
-
-                collected_bits.append(str(r & 1))
-                if (
-                    len(collected_bits) >= delimiter_len
-                    and "".join(collected_bits[-delimiter_len:]) == delimiter_bin
-                ):
-                    break
-
-                collected_bits.append(str(g & 1))
-                if (
-                    len(collected_bits) >= delimiter_len
-                    and "".join(collected_bits[-delimiter_len:]) == delimiter_bin
-                ):
-                    break
-
-                collected_bits.append(str(b & 1))
-                if (
-                    len(collected_bits) >= delimiter_len
-                    and "".join(collected_bits[-delimiter_len:]) == delimiter_bin
-                ):
-                    break
+        image_path = _as_image(image_path)
+        if memory_map is not False and engine != "reference":
+            if _is_path(image_path):
+                source = _open_mapped(image_path)
+            if memory_map and source is None:
+                return {"error": "This image cannot be memory-mapped."}
+        if source is None and streaming is not False and engine != "reference":
+            if _is_path(image_path):
+                source = _open_png_rows(image_path)
+            if streaming and source is None:
+                return {"error": "This image cannot be streamed."}
+        if source is not None:
+            img = source
+        elif engine == "reference":
+            img = _open_image(image_path).convert("RGB")
+        else:
+            img = _carrier_image(_open_image(image_path))
+        if timer:
+            timer.lap("open")
+
+        logging.info(f"Extracting data ({engine} engine)...")
+        header = parse_header(READ_ENGINES[engine](img, HEADER_BLOCK_SIZE))
+        codec = CODEC_ZLIB
+        kdf_iterations = PBKDF2_ITERATIONS
+        checksums = None
+        checksum_group = 0
+        payload_lane, bits, alpha = 0, 1, False
+        available, interleaved = None, False
+
+        if header is not None:
+            logging.info(
+                f"Found v{header['version']} container: level {header['level']}, "
+                f"{header['payload_length']} bytes, RS: {header['enable_rs']}"
+            )
+            bits = header["bits_per_channel"]
+            length = header["payload_length"]
+            alpha = header["alpha"]
+            if header["enable_rs"]:
+                checksum_group = header["checksum_group"]
+            if checksum_group:
+                table = rs_checksums_size(length, checksum_group)
             else:
-                continue
-            break
-
-        full_binary = "".join(collected_bits)
-
-        if full_binary.endswith(delimiter_bin):
-            # Remove delimiter
-            content_binary = full_binary[:-delimiter_len]
-            content_bytes = bin_to_bytes(content_binary)
+                table = 0
+            if alpha and not _CARRIER_LAYOUTS[img.mode][2]:
+                mode = CARRIER_MODES[header["carrier_mode"]]
+                return {
+                    "error": f"The payload uses the alpha channel of a {mode} image, but this image is {img.mode}."
+                }
+            if bits == 1 and not alpha:
+                container = READ_ENGINES[engine](
+                    img, HEADER_BLOCK_SIZE + length + table
+                )
+                content_bytes = memoryview(container)[HEADER_BLOCK_SIZE:]
+            else:
+                content_bytes = memoryview(
+                    READ_ENGINES[engine](
+                        img, length + table, _payload_lane(img.mode, alpha), bits, alpha
+                    )
+                )
+            available = len(content_bytes)
+            if available < length + table:
+                # A crop may cost at most as many bytes as are left; a longer
+                # shortfall means a damaged or forged payload_length, which
+                # must not be padded out
+                missing = length + table - available
+                if not header["enable_rs"] or missing > available:
+                    return {"error": "Payload extends past the end of the image."}
+                # Cropped image: RS may still rebuild the rows that are gone
+                logging.info("Payload is cut short, treating the rest as erased")
+                content_bytes = bytearray(content_bytes)
+                content_bytes += bytes(length + table - available)
+            payload_lane = _payload_lane(img.mode, alpha)
+            checksums = content_bytes[length:]
+            content_bytes = content_bytes[:length]
+            interleaved = header["interleave"]
+            if interleaved:
+                content_bytes = rs_deinterleave(content_bytes)
+            enable_rs = header["enable_rs"]
+            nsym = header["nsym"]
+            codec = header["codec"]
+            if header["kdf"] == KDF_PBKDF2_SHA256:
+                kdf_iterations = header["kdf_iterations"]
+
+            if header["level"] == "advanced" and not password:
+                return {"error": "This message is password protected."}
+            if header["level"] == "premium" and not private_key_path:
+                return {"error": "This message requires a private key."}
+            if header["level"] == "basic":
+                password = private_key_path = None
+        else:
+            logging.info("No container header found, scanning for delimiter...")
+            if isinstance(source, _PngRows) or img.mode != "RGB":
+                if source is not None:
+                    source.close()
+                img = _open_image(image_path)
+            content_bytes = EXTRACT_ENGINES[engine](
+                img if img.mode == "RGB" else img.convert("RGB")
+            )
+        if timer:
+            timer.lap("read")
 
+        if content_bytes is not None:
             # Decode Reed-Solomon if enabled
             if enable_rs:
                 logging.info(f"Decoding with Reed-Solomon, nsym={nsym}")
-                content_bytes = rs_decode(content_bytes, nsym)
-                if content_bytes is None:
+
+                def erasures():
+                    logging.info("Looking for wiped regions to use as erasures...")
+                    carrier = img
+                    if isinstance(img, _PngRows):
+                        carrier = _PngRows(image_path)
+                    elif img.mode not in _CARRIER_LAYOUTS:
+                        carrier = img.convert("RGB")
+                    length = len(content_bytes)
+                    try:
+                        positions = find_erasures(
+                            carrier, length, payload_lane, bits, alpha
+                        )
+                    finally:
+                        if carrier is not img:
+                            carrier.close()
+                    if interleaved:
+                        positions = rs_interleaved_positions(positions, length)
+                    return positions
+
+                # Bytes cut off by a crop are erasures that must be rebuilt
+                missing = None
+                if available is not None and available < len(content_bytes):
+                    missing = list(range(available, len(content_bytes)))
+                    if interleaved:
+                        missing = rs_interleaved_positions(missing, len(content_bytes))
+
+                content_bytes, failed = rs_decode_blocks(
+                    content_bytes,
+                    nsym,
+                    workers=workers,
+                    checksums=checksums,
+                    group=checksum_group,
+                    erasures=erasures,
+                    missing=missing,
+                )
+                if failed:
+                    logging.error(
+                        f"Reed-Solomon decoding failed for bytes {_format_ranges(failed)}"
+                    )
                     return {
-                        "error": "Reed-Solomon decoding failed. Data may be corrupted."
+                        "error": "Reed-Solomon decoding failed for bytes "
+                        f"{_format_ranges(failed)} of {len(content_bytes)}. "
+                        "Data may be corrupted.",
+                        "failed_ranges": failed,
                     }
+                if timer:
+                    timer.lap("rs")
 
             decrypted_data = None
 
             if password:
                 logging.info("Decrypting message with password...")
                 try:
-                    decrypted_data = decrypt_message_password(content_bytes, password)
+                    decrypted_data = decrypt_message_password(
+                        content_bytes, password, iterations=kdf_iterations
+                    )
                 except Exception as e:
                     return {"error": f"Decryption failed: {e}"}
             elif private_key_path:
@@ -540,29 +2914,38 @@ def extract_message(
             else:
                 # Assume plain text (compressed)
                 decrypted_data = content_bytes
+            if timer:
+                timer.lap("decrypt")
 
             # Decompress
             try:
-                logging.info("Decompressing data...")
-                decompressed_bytes = zlib.decompress(decrypted_data)
-                decrypted_json_str = decompressed_bytes.decode("utf-8")
+                if codec == CODEC_NONE:
+                    decrypted_json_str = bytes(decrypted_data).decode("utf-8")
+                else:
+                    logging.info("Decompressing data...")
+                    decompressed_bytes = zlib.decompress(decrypted_data)
+                    decrypted_json_str = decompressed_bytes.decode("utf-8")
             except zlib.error:
                 # Fallback for backward compatibility (uncompressed data)
                 # If decompression fails, maybe it wasn't compressed (old images)
                 try:
-                    decrypted_json_str = decrypted_data.decode("utf-8")
+                    decrypted_json_str = bytes(decrypted_data).decode("utf-8")
                 except:
                     return {
                         "error": "Decompression failed and could not decode as text."
                     }
             except Exception as e:
                 return {"error": f"Decompression error: {e}"}
+            if timer:
+                timer.lap("decompress")
 
             # Parse JSON
             try:
                 payload = json.loads(decrypted_json_str)
                 # Auto-unzip if zipped
                 if payload.get("type") == "file" and payload.get("zipped"):
+                    import zipfile
+
                     zip_data = base64.b64decode(payload["data"])
                     zip_buffer = io.BytesIO(zip_data)
                     with zipfile.ZipFile(zip_buffer, "r") as zip_file:
@@ -571,10 +2954,12 @@ def extract_message(
                             zip_file.read(file_name)
                         ).decode()
                     payload["zipped"] = False
-                return payload
             except json.JSONDecodeError:
                 # Backward compatibility: It might be a plain string from previous version
-                return {"type": "text", "data": decrypted_json_str}
+                payload = {"type": "text", "data": decrypted_json_str}
+            if timer:
+                timer.lap("parse")
+            return payload
 
         else:
             return {"error": "No hidden message found or delimiter missing."}
@@ -582,6 +2967,9 @@ def extract_message(
     except Exception as e:
         logging.error(f"Error in extract_message: {e}")
         return {"error": f"Error: {e}"}
+    finally:
+        if source is not None:
+            source.close()
 
 
 def generate_nft_metadata(owner_wallet, faction, superpower, keys_clue, level):
@@ -599,7 +2987,7 @@ def generate_nft_metadata(owner_wallet, faction, superpower, keys_clue, level):
 
 
 def embed_nft_secret(
-    image_path, owner_wallet, faction, superpower, keys_clue, level, output_path
+    image_path, owner_wallet, faction, superpower, keys_clue, level, output_path=None
 ):
     """Embeds owner-specific NFT data into image."""
     secret_data = generate_nft_metadata(
@@ -621,21 +3009,44 @@ def extract_nft_secret(image_path, owner_wallet):
     return None
 
 
-def calculate_capacity(image_path):
-    """Calculates the maximum message size for a given image."""
+def calculate_capacity(image_path, bits_per_channel=1, use_alpha=False):
+    """Calculates the maximum message size for a given image.
+
+    image_path: A path, bytes, binary file object, PIL image or array
+    bits_per_channel: LSBs used per colour channel (1-4), as in hide_message
+    use_alpha: Count the alpha channel too, as in hide_message
+
+    Returns the payload bytes a v2 container can hold: the header lanes are
+    always written at 1 bit each, so they are taken off before scaling by
+    bits_per_channel.
+    """
+    if not 1 <= bits_per_channel <= MAX_BITS_PER_CHANNEL:
+        raise ValueError(
+            f"bits_per_channel must be between 1 and {MAX_BITS_PER_CHANNEL}"
+        )
     try:
-        img = Image.open(image_path)
-        width, height = img.size
+        image = _as_image(image_path)
+        img = _is_path(image) and _open_mapped(image) or _open_image(image)
+        try:
+            width, height = img.size
+            mode = _carrier_mode(img)
+        finally:
+            if img is not image_path:
+                img.close()
         total_pixels = width * height
-        max_bits = total_pixels * 3
+        lanes = len(_carrier_lanes(mode, use_alpha)[1])
+        payload_lanes = max(0, total_pixels * lanes - _payload_lane(mode, use_alpha))
+        max_bits = payload_lanes * bits_per_channel
         max_bytes = max_bits // 8
 
         logging.info(f"Image Dimensions: {width}x{height}")
         logging.info(f"Total Pixels: {total_pixels}")
-        logging.info(f"Max Capacity: {max_bits} bits")
+        logging.info(f"Carrier Mode: {mode} ({lanes} channels)")
+        logging.info(f"Bits per Channel: {bits_per_channel}")
+        logging.info(f"Max Capacity: {max_bits} bits after the header")
         logging.info(f"Max Message Size: approx {max_bytes} characters (bytes)")
         logging.info(
-            f"(Note: Encryption adds overhead, and the delimiter takes {len(DELIMITER)} bytes)"
+            f"(Note: Encryption adds overhead; the {HEADER_BLOCK_SIZE} byte container header is already taken off)"
         )
         return max_bytes
     except Exception as e:
@@ -643,20 +3054,29 @@ def calculate_capacity(image_path):
         return 0
 
 
-def metawipe_image(image_path, output_path):
-    """Remove EXIF metadata from an image."""
+def metawipe_image(image_path, output_path=None):
+    """Remove EXIF metadata from an image.
+
+    image_path and output_path take the same forms as in hide_message;
+    returns output_path, or the PNG bytes when it is None.
+    """
     try:
-        with Image.open(image_path) as img:
+        image = _as_image(image_path)
+        img = _open_image(image)
+        try:
             # Create a new image without EXIF data
             img_no_exif = Image.new(img.mode, img.size)
-            img_no_exif.putdata(list(img.getdata()))
-            img_no_exif.save(output_path)
-        return output_path
+            img_no_exif.frombytes(img.tobytes())
+        finally:
+            if img is not image_path:
+                img.close()
+        return _save_image(img_no_exif, output_path)
     except Exception as e:
         raise Exception(f"Failed to wipe metadata: {str(e)}")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     print("--- Steganography Image Hider (Secure) ---")
     print("1. Generate Keys")
     print("2. Embed Message")
@@ -0,0 +1,559 @@
+import concurrent.futures
+import os
+import random
+import subprocess
+import sys
+
+from PIL import Image
+import pytest
+import reedsolo
+
+import steg_hider
+from steg_hider import (
+    HEADER_BLOCK_SIZE,
+    build_header,
+    parse_header,
+    hide_message,
+    extract_message,
+)
+
+
+def make_noise_cover(path, size=(80, 60), seed=7):
+    rng = random.Random(seed)
+    img = Image.new("RGB", size)
+    img.putdata(
+        [
+            (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+            for _ in range(size[0] * size[1])
+        ]
+    )
+    img.save(path, format="PNG")
+
+
+def test_header_roundtrip_survives_byte_errors():
+    block = bytearray(build_header("advanced", 1234, enable_rs=True, nsym=16))
+    assert len(block) == HEADER_BLOCK_SIZE
+    for i in (0, 9, 20, 33, 50):
+        block[i] ^= 0xFF
+    header = parse_header(bytes(block))
+    assert header["level"] == "advanced"
+    assert header["enable_rs"] and header["nsym"] == 16
+    assert header["payload_length"] == 1234
+
+
+def test_parse_header_rejects_random_data():
+    assert (
+        parse_header(bytes(random.Random(1).randrange(256) for _ in range(64))) is None
+    )
+    assert parse_header(b"short") is None
+
+
+@pytest.mark.parametrize("engine", list(steg_hider.EXTRACT_ENGINES))
+def test_legacy_delimiter_images_still_extract(tmp_path, engine):
+    cover = tmp_path / "cover.png"
+    make_noise_cover(str(cover))
+    out = tmp_path / "legacy.png"
+    hide_message(str(cover), "old format", str(out), container_version=1)
+    assert extract_message(str(out), engine=engine)["data"] == "old format"
+
+
+def test_v2_rs_settings_come_from_header(tmp_path):
+    cover = tmp_path / "cover.png"
+    make_noise_cover(str(cover))
+    out = tmp_path / "rs.png"
+    hide_message(str(cover), "parity inside", str(out), enable_rs=True, nsym=12)
+    # No enable_rs/nsym on the extraction side: the header carries them
+    assert extract_message(str(out))["data"] == "parity inside"
+
+
+def test_v2_password_level(tmp_path):
+    cover = tmp_path / "cover.png"
+    make_noise_cover(str(cover))
+    out = tmp_path / "pw.png"
+    hide_message(str(cover), "locked", str(out), password="pw", level="advanced")
+    assert "error" in extract_message(str(out))
+    assert extract_message(str(out), password="pw")["data"] == "locked"
+
+
+def make_mode_cover(path, mode, size=(80, 60), seed=11):
+    rng = random.Random(seed)
+    pixel_bytes = steg_hider._CARRIER_LAYOUTS[mode][0]
+    raw = bytes(rng.randrange(256) for _ in range(size[0] * size[1] * pixel_bytes))
+    Image.frombytes(mode, size, raw).save(path, format="PNG")
+
+
+@pytest.mark.parametrize("engine", ["stdlib", "numpy"])
+@pytest.mark.parametrize("mode", ["RGBA", "L", "LA", "I;16"])
+def test_native_carrier_modes_roundtrip(tmp_path, mode, engine):
+    if engine not in steg_hider.EMBED_ENGINES:
+        pytest.skip("numpy not installed")
+    cover = tmp_path / "cover.png"
+    stego = tmp_path / "stego.png"
+    make_mode_cover(cover, mode)
+    hide_message(str(cover), "native " + mode, str(stego), engine=engine)
+
+    with Image.open(cover) as before, Image.open(stego) as after:
+        assert after.mode == before.mode == mode
+        assert parse_header(steg_hider._read_stdlib(after, HEADER_BLOCK_SIZE))[
+            "carrier_mode"
+        ] == steg_hider.CARRIER_MODES.index(mode)
+    assert extract_message(str(stego), engine=engine)["data"] == "native " + mode
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "LA"])
+def test_alpha_lanes_carry_payload(tmp_path, mode):
+    cover = tmp_path / "cover.png"
+    stego = tmp_path / "stego.png"
+    make_mode_cover(cover, mode)
+    secret = "a" * 600
+    hide_message(str(cover), secret, str(stego), use_alpha=True, bits_per_channel=2)
+    assert extract_message(str(stego))["data"] == secret
+
+    with Image.open(cover) as before, Image.open(stego) as after:
+        alpha = len(mode) - 1
+        assert before.getchannel(alpha).tobytes() != after.getchannel(alpha).tobytes()
+        after.convert("RGB").save(tmp_path / "flat.png")
+    assert "error" in extract_message(str(tmp_path / "flat.png"))
+
+
+def test_use_alpha_needs_alpha_channel(tmp_path):
+    cover = tmp_path / "cover.png"
+    make_noise_cover(cover)
+    with pytest.raises(ValueError):
+        hide_message(str(cover), "x", str(tmp_path / "out.png"), use_alpha=True)
+    assert (
+        steg_hider.calculate_capacity(str(cover))
+        == (80 * 60 * 3 - steg_hider.HEADER_LANES) // 8
+    )
+
+
+def test_rs_codecs_are_cached_and_interoperable():
+    assert steg_hider.get_rs_codec(12) is steg_hider.get_rs_codec(12)
+    data = bytes(range(256)) * 3
+    encoded = bytearray(steg_hider.rs_encode(data, 12))
+    assert encoded == reedsolo.RSCodec(12).encode(data)
+    encoded[5] ^= 0xFF
+    assert steg_hider.rs_decode(encoded, 12) == data
+
+
+@pytest.mark.parametrize("nsym", [4, 10, 32])
+def test_batched_rs_matches_reedsolo(nsym):
+    rng = random.Random(nsym)
+    data = bytes(rng.randrange(256) for _ in range((255 - nsym) * 9 + 17))
+    encoded = steg_hider.rs_encode(data, nsym)
+    assert encoded == reedsolo.RSCodec(nsym).encode(data)
+
+    damaged = bytearray(encoded)
+    for block in (0, 4, 9):
+        for i in range(nsym // 2):
+            damaged[
+                block * 255 + rng.randrange(255 if block < 9 else 17 + nsym)
+            ] ^= 0x5A
+    assert steg_hider.rs_decode(damaged, nsym) == data
+
+
+def no_process_pool(workers):
+    raise OSError("no /dev/shm")
+
+
+@pytest.mark.parametrize("workers", [1, 2, "no pool"])
+def test_rs_decode_blocks_reports_lost_ranges(monkeypatch, workers):
+    monkeypatch.setattr(steg_hider, "RS_PARALLEL_MIN_CODEWORDS", 2)
+    if workers == "no pool":
+        # e.g. a serverless host: fall back to decoding serially
+        monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", no_process_pool)
+        workers = 2
+    rng = random.Random(5)
+    data = bytes(rng.randrange(256) for _ in range(245 * 12 + 100))
+    damaged = bytearray(steg_hider.rs_encode(data, 10))
+    for block in range(13):
+        damaged[block * 255 + 3] ^= 0x11
+    for block in (2, 3, 12):
+        for i in range(8):
+            damaged[block * 255 + i * 9] ^= 0xA5
+
+    decoded, failed = steg_hider.rs_decode_blocks(damaged, 10, workers=workers)
+    assert failed == [(490, 980), (2940, 3040)]
+    assert decoded[:490] == data[:490] and decoded[980:2940] == data[980:2940]
+    assert steg_hider.rs_decode(damaged, 10) is None
+
+
+def test_extract_workers_controls_the_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(steg_hider, "RS_PARALLEL_MIN_CODEWORDS", 2)
+    monkeypatch.setattr(steg_hider, "RS_WORKERS", 2)
+    pooled = []
+    pool_map = steg_hider._pool_map
+    monkeypatch.setattr(
+        steg_hider,
+        "_pool_map",
+        lambda fn, jobs, workers, pool=None: pooled.append(workers)
+        or pool_map(fn, jobs, workers, pool),
+    )
+    cover = tmp_path / "cover.png"
+    stego = tmp_path / "stego.png"
+    make_noise_cover(cover, size=(160, 120))
+    rng = random.Random(3)
+    message = "".join(chr(rng.randrange(33, 123)) for _ in range(1500))
+    hide_message(str(cover), message, str(stego), enable_rs=True, nsym=20)
+    damaged = steg_hider.simulate_lsb_flip(str(stego), 0.5, seed=4)
+
+    assert extract_message(damaged, workers=1)["data"] == message
+    assert pooled == []
+    assert extract_message(damaged)["data"] == message
+    assert pooled == [2]
+
+
+def test_checksummed_groups_skip_rs(monkeypatch):
+    rng = random.Random(9)
+    data = bytes(rng.randrange(256) for _ in range(245 * 40))
+    encoded = steg_hider.rs_encode(data, 10)
+    checksums = steg_hider.rs_checksums(encoded, 8)
+    assert len(checksums) == steg_hider.rs_checksums_size(len(encoded), 8) == 20
+
+    checked = []
+    dirty = steg_hider._rs_dirty_codewords
+    monkeypatch.setattr(
+        steg_hider,
+        "_rs_dirty_codewords",
+        lambda words, nsym: checked.append(len(words)) or dirty(words, nsym),
+    )
+    damaged = bytearray(encoded)
+    damaged[255 * 17 + 4] ^= 0xFF
+    decoded, failed = steg_hider.rs_decode_blocks(
+        damaged, 10, checksums=checksums, group=8
+    )
+    assert decoded == data and not failed
+    assert checked == [8]
+
+    bad_table = bytearray(checksums)
+    bad_table[0] ^= 1
+    assert steg_hider.rs_decode_blocks(encoded, 10, checksums=bad_table, group=8) == (
+        data,
+        [],
+    )
+
+
+def test_rs_payload_carries_checksums(tmp_path):
+    cover = tmp_path / "cover.png"
+    stego = tmp_path / "stego.png"
+    make_noise_cover(cover, size=(160, 120))
+    hide_message(str(cover), "k" * 4000, str(stego), enable_rs=True, nsym=8)
+    with Image.open(stego) as img:
+        header = parse_header(steg_hider._read_stdlib(img, HEADER_BLOCK_SIZE))
+    assert header["checksum_group"] == steg_hider.RS_CHECKSUM_GROUP
+    assert extract_message(str(stego))["data"] == "k" * 4000
+
+
+def test_wiped_runs_are_decoded_as_erasures(tmp_path):
+    cover = tmp_path / "cover.png"
+    stego = tmp_path / "stego.png"
+    make_noise_cover(cover, size=(300, 200))
+    rng = random.Random(1)
+    message = "".join(chr(33 + rng.randrange(90)) for _ in range(6000))
+    hide_message(str(cover), message, str(stego), enable_rs=True, nsym=20)
+
+    with Image.open(stego) as img:
+        # 50 pixels = 150 lanes: ~19 bytes of one codeword, past nsym / 2
+        img.paste((0, 0, 0), (100, 5, 150, 6))
+        img.paste((200, 30, 90), (10, 40, 60, 41))
+        img.save(stego)
+        header = parse_header(steg_hider._read_stdlib(img, HEADER_BLOCK_SIZE))
+        length = header["payload_length"]
+        payload = steg_hider._read_stdlib(img, HEADER_BLOCK_SIZE + length)[64:]
+        erasures = steg_hider.find_erasures(img, length, steg_hider.HEADER_LANES)
+
+    assert len(erasures) > 2 * 10
+    assert steg_hider.rs_decode_blocks(payload, 20)[1]
+    decoded, failed = steg_hider.rs_decode_blocks(
+        payload, 20, erasures=lambda: erasures
+    )
+    assert not failed
+    assert extract_message(str(stego))["data"] == message
+
+
+def test_rs_interleave_roundtrip():
+    rng = random.Random(3)
+    data = bytes(rng.randrange(256) for _ in range(255 * 4 + 37))
+    striped = steg_hider.rs_interleave(data)
+    assert striped != data
+    assert steg_hider.rs_deinterleave(striped) == data
+    positions = [0, 5, len(data) - 1, 600]
+    mapped = steg_hider.rs_interleaved_positions(positions, len(data))
+    assert sorted(striped[p] for p in positions) == sorted(data[p] for p in mapped)
+
+
+def hide_random_message(tmp_path, interleave):
+    cover = tmp_path / "cover.png"
+    stego = tmp_path / f"stego-{interleave}.png"
+    make_noise_cover(cover, size=(400, 300))
+    rng = random.Random(5)
+    message = "".join(chr(33 + rng.randrange(90)) for _ in range(20000))
+    hide_message(
+        str(cover), message, str(stego), enable_rs=True, nsym=20, interleave=interleave
+    )
+    return stego, message
+
+
+@pytest.mark.parametrize("interleave", [False, True])
+def test_interleave_survives_wiped_band(tmp_path, interleave):
+    stego, message = hide_random_message(tmp_path, interleave)
+    with Image.open(stego) as img:
+        # 2000 pixels = 750 bytes: three whole codewords, or ~9 bytes of each
+        img.paste((0, 0, 0), (0, 60, 400, 65))
+        img.save(stego)
+    result = extract_message(str(stego))
+    if interleave:
+        assert result["data"] == message
+    else:
+        assert "failed_ranges" in result
+
+
+@pytest.mark.parametrize("interleave", [False, True])
+def test_interleave_survives_bottom_crop(tmp_path, interleave):
+    stego, message = hide_random_message(tmp_path, interleave)
+    with Image.open(stego) as img:
+        header = parse_header(steg_hider._read_stdlib(img, HEADER_BLOCK_SIZE))
+        used = HEADER_BLOCK_SIZE + header["payload_length"]
+        used += steg_hider.rs_checksums_size(
+            header["payload_length"], header["checksum_group"]
+        )
+        last_row = -(-used * 8 // (3 * img.width))
+        img.crop((0, 0, img.width, last_row - 4)).save(stego)
+    result = extract_message(str(stego))
+    if interleave:
+        assert result["data"] == message
+    else:
+        assert "failed_ranges" in result
+
+
+def test_crop_of_whole_codewords_is_reported_not_zeroed(tmp_path):
+    stego, message = hide_random_message(tmp_path, False)
+    with Image.open(stego) as img:
+        header = parse_header(steg_hider._read_stdlib(img, HEADER_BLOCK_SIZE))
+        length = header["payload_length"]
+        # Keep 3/4 of the payload: the last ~20 codewords are gone entirely
+        rows = (HEADER_BLOCK_SIZE + length * 3 // 4) * 8 // (3 * img.width)
+        img.crop((0, 0, img.width, rows)).save(stego)
+    result = extract_message(str(stego))
+    assert "failed_ranges" in result
+    size, nsym = steg_hider.RS_CODEWORD_SIZE, header["nsym"]
+    lost = length // 4 // size * (size - nsym)
+    start, end = result["failed_ranges"][-1]
+    assert end == length - nsym * -(-length // size)
+    assert end - start >= lost
+
+
+def test_forged_payload_length_is_rejected(tmp_path):
+    stego = tmp_path / "forged.png"
+    img = Image.new("RGB", (64, 64))
+    header = build_header("basic", 600_000_000, enable_rs=True, nsym=20)
+    steg_hider._embed_stdlib(img, header)
+    img.save(stego)
+    result = extract_message(str(stego))
+    assert result["error"] == "Payload extends past the end of the image."
+
+
+def test_auto_tune_picks_smallest_surviving_parity(tmp_path, monkeypatch):
+    cover = tmp_path / "cover.png"
+    stego = tmp_path / "stego.png"
+    make_noise_cover(cover, size=(300, 200))
+    rng = random.Random(9)
+    message = "".join(chr(33 + rng.randrange(90)) for _ in range(2000))
+    hide_message(
+        str(cover),
+        message,
+        str(stego),
+        enable_rs=True,
+        auto_tune=True,
+        expected_corruption=2,
+    )
+    with Image.open(stego) as img:
+        header = parse_header(steg_hider._read_stdlib(img, HEADER_BLOCK_SIZE))
+        # The old heuristic asked for 255 here
+        assert 10 < header["nsym"] < 100
+        damaged = steg_hider.simulate_lsb_flip(img, 2, seed=4)
+    damaged.save(stego)
+    assert extract_message(str(stego))["data"] == message
+
+    payload = bytes(rng.randrange(256) for _ in range(1000))
+    with Image.open(cover) as img:
+        tuned = [
+            steg_hider.auto_tune_parity(img, 2, payload=payload, workers=workers)
+            for workers in (1, 2)
+        ]
+        monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", no_process_pool)
+        tuned.append(steg_hider.auto_tune_parity(img, 2, payload=payload, workers=2))
+    assert tuned[0] == tuned[1] == tuned[2]
+
+    # The original two-argument form tunes for a random stand-in payload
+    nsym = steg_hider.auto_tune_parity(str(cover), 2)
+    assert 1 <= nsym < steg_hider.RS_CODEWORD_SIZE
+    assert steg_hider.auto_tune_parity(str(cover), 2) == nsym
+
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_simulators_are_seeded_and_chainable(tmp_path, monkeypatch, numpy):
+    if not numpy:
+        monkeypatch.setattr(steg_hider, "np", None)
+    cover = tmp_path / "cover.png"
+    make_noise_cover(cover, size=(120, 90))
+    with Image.open(cover) as img:
+        original = img.tobytes()
+        flipped = steg_hider.simulate_lsb_flip(img, 10, seed=3)
+        assert img.tobytes() == original
+    changed = sum(a != b for a, b in zip(original, flipped.tobytes()))
+    assert changed == 3 * int(0.10 * 120 * 90)
+    assert steg_hider.simulate_lsb_flip(str(cover), 10, seed=3) == flipped
+
+    steps = [("lsb_flip", 5), ("zero_region", 4), ("jpeg", 90), ("resize", 0.5)]
+    out = tmp_path / "damaged.png"
+    chained = steg_hider.simulate_chain(str(cover), steps, str(out), seed=8)
+    assert chained.size == (120, 90)
+    with Image.open(out) as saved:
+        assert saved.tobytes() == chained.tobytes()
+    assert steg_hider.simulate_chain(str(cover), steps, seed=8) == chained
+    with pytest.raises(ValueError):
+        steg_hider.simulate_chain(str(cover), [("blur", 1)])
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "LA"])
+def test_zero_region_keeps_alpha_opaque(mode):
+    img = Image.new(mode, (40, 30), (200,) * len(mode))
+    zeroed = steg_hider.simulate_zero_region(img, 100, seed=1)
+    assert zeroed.getextrema() == ((0, 0),) * (len(mode) - 1) + ((255, 255),)
+
+
+def test_stage_timings_and_hooks(tmp_path):
+    cover = tmp_path / "cover.png"
+    stego = tmp_path / "stego.png"
+    make_noise_cover(cover, size=(120, 90))
+    calls = []
+    hook = steg_hider.add_stage_hook(lambda *call: calls.append(call))
+    try:
+        hide_stats = steg_hider.StageTimings()
+        hide_message(
+            str(cover),
+            "timed",
+            str(stego),
+            password="pw",
+            level="advanced",
+            enable_rs=True,
+            stats=hide_stats,
+        )
+        extract_stats = steg_hider.StageTimings()
+        result = extract_message(str(stego), password="pw", stats=extract_stats)
+    finally:
+        steg_hider.remove_stage_hook(hook)
+    assert result["data"] == "timed"
+
+    assert list(hide_stats.stages) == [
+        "open",
+        "payload",
+        "compress",
+        "encrypt",
+        "rs",
+        "embed",
+        "save",
+    ]
+    assert list(extract_stats.stages) == [
+        "open",
+        "read",
+        "rs",
+        "decrypt",
+        "decompress",
+        "parse",
+    ]
+    # PBKDF2 dominates both calls
+    assert max(hide_stats.stages, key=hide_stats.stages.get) == "encrypt"
+    assert max(extract_stats.stages, key=extract_stats.stages.get) == "decrypt"
+    assert [c[:2] for c in calls] == [("hide", s) for s in hide_stats.stages] + [
+        ("extract", s) for s in extract_stats.stages
+    ]
+    assert sum(c[2] for c in calls[:7]) == pytest.approx(hide_stats.total)
+
+    calls.clear()
+    extract_message(str(stego), password="pw")
+    assert calls == []
+
+
+def test_profiling_writes_pstats_and_collapsed_stacks(tmp_path, monkeypatch):
+    import pstats
+
+    cover = tmp_path / "cover.png"
+    stego = tmp_path / "stego.png"
+    profiles = tmp_path / "profiles"
+    make_noise_cover(cover)
+    monkeypatch.setattr(steg_hider, "PROFILE_DIR", str(profiles))
+
+    hide_message(str(cover), "profiled", str(stego), profile=True)
+    monkeypatch.setattr(steg_hider, "PROFILE_RATE", 1.0)
+    assert extract_message(str(stego))["data"] == "profiled"
+    extract_message(str(stego), profile=False)
+
+    names = sorted(p.name for p in profiles.iterdir())
+    assert [n.split("-")[0] + n[n.rindex(".") :] for n in names] == [
+        "extract_message.collapsed",
+        "extract_message.pstats",
+        "hide_message.collapsed",
+        "hide_message.pstats",
+    ]
+    stats = pstats.Stats(str(profiles / names[3]))
+    assert any(func[2] == "hide_message" for func in stats.stats)
+    lines = (profiles / names[2]).read_text().splitlines()
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any(line.startswith("hide_message (") for line in lines)
+
+
+def test_profiling_a_cold_call_is_bounded(tmp_path, monkeypatch):
+    # A fresh interpreter profiles the lazy imports too, which gives the
+    # largest call graph the collapsed-stack fold has to walk.
+    code = (
+        "import random, sys\n"
+        "from PIL import Image\n"
+        "sys.path.insert(0, sys.argv[1])\n"
+        "import steg_hider\n"
+        "rng = random.Random(1)\n"
+        "img = Image.frombytes('RGB', (200, 150), rng.randbytes(200 * 150 * 3))\n"
+        "steg_hider.hide_message(img, 'x' * 3000, password='pw', level='advanced',"
+        " enable_rs=True, auto_tune=True, workers=1, profile=True)\n"
+    )
+    root = os.path.dirname(os.path.abspath(steg_hider.__file__))
+    subprocess.run(
+        [sys.executable, "-c", code, root],
+        cwd=tmp_path,
+        capture_output=True,
+        check=True,
+        timeout=60,
+    )
+    (collapsed,) = (tmp_path / "profiles").glob("*.collapsed")
+    lines = collapsed.read_text().splitlines()
+    assert 0 < len(lines) <= steg_hider.COLLAPSE_MAX_PATHS
+
+    def fail(stats):
+        raise MemoryError
+
+    cover = tmp_path / "cover.png"
+    make_noise_cover(cover)
+    monkeypatch.setattr(steg_hider, "PROFILE_DIR", str(tmp_path / "failed"))
+    monkeypatch.setattr(steg_hider, "_collapsed_stacks", fail)
+    result = hide_message(str(cover), "still hidden", profile=True)
+    assert extract_message(result["output"])["data"] == "still hidden"
+
+
+def test_import_defers_heavy_dependencies():
+    code = (
+        "import sys, steg_hider\n"
+        "heavy = ('PIL', 'numpy', 'cryptography', 'reedsolo', 'zipfile', 'cProfile')\n"
+        "print(' '.join(m for m in heavy if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(steg_hider.__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == ""
+    # the lazy stand-ins resolve on first use
+    assert steg_hider.Image.new("L", (1, 1)).size == (1, 1)
+    assert steg_hider._rs_backend.RSCodec(4).encode(b"ab")[:2] == b"ab"
@@ -0,0 +1,370 @@
+import io
+import os
+import random
+import struct
+
+from PIL import Image
+import pytest
+
+import steg_hider
+from steg_hider import hide_message, extract_message
+
+
+def make_noise_cover(path, size=(64, 48), seed=1234):
+    rng = random.Random(seed)
+    img = Image.new("RGB", size)
+    img.putdata(
+        [
+            (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+            for _ in range(size[0] * size[1])
+        ]
+    )
+    img.save(path, format="PNG")
+
+
+@pytest.mark.parametrize(
+    "engine", [e for e in steg_hider.EMBED_ENGINES if e != "reference"]
+)
+def test_embed_engine_matches_reference(tmp_path, engine):
+    cover = tmp_path / "cover.png"
+    make_noise_cover(str(cover))
+
+    ref_out = tmp_path / "ref.png"
+    fast_out = tmp_path / f"{engine}.png"
+    message = "byte-identical " * 20
+    hide_message(str(cover), message, str(ref_out), engine="reference")
+    hide_message(str(cover), message, str(fast_out), engine=engine)
+
+    with Image.open(ref_out) as a, Image.open(fast_out) as b:
+        assert a.tobytes() == b.tobytes()
+    with open(ref_out, "rb") as a, open(fast_out, "rb") as b:
+        assert a.read() == b.read()
+
+    assert extract_message(str(fast_out))["data"] == message
+
+
+def test_unknown_engine_rejected(tmp_path):
+    cover = tmp_path / "cover.png"
+    make_noise_cover(str(cover))
+    with pytest.raises(ValueError):
+        hide_message(str(cover), "x", str(tmp_path / "out.png"), engine="nope")
+
+
+@pytest.mark.parametrize("engine", list(steg_hider.EXTRACT_ENGINES))
+def test_extract_engines_agree(tmp_path, monkeypatch, engine):
+    # Tiny first block so the payload spans several growing row blocks
+    monkeypatch.setattr(steg_hider, "EXTRACT_FIRST_BLOCK_BYTES", 16)
+    cover = tmp_path / "cover.png"
+    make_noise_cover(str(cover), size=(40, 200))
+    out = tmp_path / "out.png"
+    message = "row blocks " * 300
+    hide_message(str(cover), message, str(out))
+    assert extract_message(str(out), engine=engine)["data"] == message
+
+
+@pytest.mark.parametrize("engine", list(steg_hider.EXTRACT_ENGINES))
+def test_extract_without_payload(tmp_path, engine):
+    cover = tmp_path / "cover.png"
+    make_noise_cover(str(cover))
+    result = extract_message(str(cover), engine=engine)
+    assert "error" in result
+
+
+def test_bit_string_shims_match_original_semantics():
+    data = bytes(range(256))
+    assert steg_hider.data_to_bin(data) == "".join(format(b, "08b") for b in data)
+    assert steg_hider.data_to_bin("hé") == "0110100011101001"
+    assert steg_hider.data_to_bin("€") == format(ord("€"), "08b")
+    assert steg_hider.data_to_bin(b"") == ""
+    assert steg_hider.bin_to_bytes(steg_hider.data_to_bin(data)) == data
+    assert steg_hider.bin_to_bytes("0000000101") == b"\x01\x01"
+
+
+def test_embed_extract_peak_memory_is_bounded(tmp_path):
+    import base64
+    import tracemalloc
+
+    cover = tmp_path / "big.png"
+    Image.frombytes("RGB", (1000, 1000), os.urandom(3_000_000)).save(cover)
+    payload = os.urandom(256 * 1024)
+    secret = {"type": "file", "name": "a.bin", "data": base64.b64encode(payload)}
+    secret["data"] = secret["data"].decode()
+    out = tmp_path / "out.png"
+
+    # The bit-string pipeline peaked at ~85x the payload on embed and ~550x
+    # on extract; the byte pipeline stays in the low teens.
+    tracemalloc.start()
+    hide_message(str(cover), secret, str(out))
+    hide_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    result = extract_message(str(out))
+    extract_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert base64.b64decode(result["data"]) == payload
+    assert hide_peak < 16 * len(payload)
+    assert extract_peak < 16 * len(payload)
+
+
+def test_stdlib_engine_picked_without_numpy():
+    import subprocess
+    import sys
+
+    code = (
+        "import sys; sys.modules['numpy'] = None; import steg_hider; "
+        "print(steg_hider.DEFAULT_ENGINE, sorted(steg_hider.EMBED_ENGINES))"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(steg_hider.__file__),
+    ).stdout
+    assert out.split()[0] == "stdlib"
+    assert "numpy" not in out
+
+
+FAST_ENGINES = [e for e in steg_hider.EMBED_ENGINES if e != "reference"]
+
+
+@pytest.mark.parametrize("bits", [1, 2, 3, 4])
+@pytest.mark.parametrize("engine", FAST_ENGINES)
+def test_engine_primitives_roundtrip_k_bits(engine, bits):
+    cover = Image.frombytes("RGB", (37, 29), os.urandom(37 * 29 * 3))
+    payload = os.urandom(301)  # not a multiple of 3 bytes: exercises padding
+    first_lane = 17
+    stego = steg_hider.EMBED_ENGINES[engine](cover.copy(), payload, first_lane, bits)
+    read = steg_hider.READ_ENGINES[engine]
+    assert bytes(read(stego, len(payload), first_lane, bits)) == payload
+    # Everything outside the payload lanes and above the low bits is untouched
+    before, after = cover.tobytes(), stego.tobytes()
+    nlanes = -(-len(payload) * 8 // bits)
+    assert before[:first_lane] == after[:first_lane]
+    assert before[first_lane + nlanes :] == after[first_lane + nlanes :]
+    high = 0xFF ^ ((1 << bits) - 1)
+    assert all((a & high) == (b & high) for a, b in zip(before, after))
+
+
+@pytest.mark.parametrize("bits", [2, 3, 4])
+def test_k_bit_embedding_is_autodetected(tmp_path, bits):
+    cover = tmp_path / "cover.png"
+    make_noise_cover(str(cover), size=(64, 48))
+    outs = []
+    for engine in FAST_ENGINES:
+        out = tmp_path / f"{engine}_{bits}.png"
+        message = "".join(chr(65 + (i * 7) % 26) for i in range(1500))
+        hide_message(
+            str(cover), message, str(out), bits_per_channel=bits, engine=engine
+        )
+        assert extract_message(str(out))["data"] == message
+        outs.append(Image.open(out).tobytes())
+    assert all(o == outs[0] for o in outs)
+
+
+def test_k_bit_capacity_scales(tmp_path):
+    cover = tmp_path / "cover.png"
+    make_noise_cover(str(cover), size=(64, 48))
+    lanes = 64 * 48 * 3 - steg_hider.HEADER_LANES
+    for bits in (1, 2, 4):
+        capacity = steg_hider.calculate_capacity(str(cover), bits_per_channel=bits)
+        assert capacity == lanes * bits // 8
+    for bits in (0, 5, -1):
+        with pytest.raises(ValueError):
+            steg_hider.calculate_capacity(str(cover), bits_per_channel=bits)
+    with pytest.raises(ValueError):
+        hide_message(
+            str(cover),
+            "x",
+            str(tmp_path / "o.png"),
+            bits_per_channel=2,
+            engine="reference",
+        )
+    with pytest.raises(ValueError):
+        hide_message(str(cover), "x", str(tmp_path / "o.png"), bits_per_channel=5)
+
+
+def make_gradient_cover(path, mode, size=(97, 120), seed=3):
+    # Smooth rows make Pillow pick Sub/Up/Average/Paeth filters, which the
+    # streaming reader has to undo band by band.
+    rng = random.Random(seed)
+    width = size[0] * steg_hider._CARRIER_LAYOUTS[mode][0]
+    raw = bytes(
+        (x * 3 + y * 5 + rng.randrange(4)) % 256
+        for y in range(size[1])
+        for x in range(width)
+    )
+    Image.frombytes(mode, size, raw).save(path, format="PNG")
+
+
+@pytest.mark.parametrize(
+    "mode, bits, use_alpha",
+    [("RGB", 1, False), ("RGB", 3, False), ("RGBA", 2, True), ("I;16", 4, False)],
+)
+def test_streaming_matches_in_memory_embedding(
+    tmp_path, monkeypatch, mode, bits, use_alpha
+):
+    monkeypatch.setattr(steg_hider, "STREAM_BAND_BYTES", 700)
+    cover = str(tmp_path / "cover.png")
+    make_gradient_cover(cover, mode)
+    message = "".join(chr(33 + (i * 11) % 90) for i in range(900))
+    options = dict(bits_per_channel=bits, use_alpha=use_alpha)
+    hide_message(cover, message, str(tmp_path / "a.png"), streaming=False, **options)
+    hide_message(cover, message, str(tmp_path / "b.png"), streaming=True, **options)
+
+    with Image.open(tmp_path / "a.png") as a, Image.open(tmp_path / "b.png") as b:
+        assert b.mode == mode
+        assert a.tobytes() == b.tobytes()
+    result = extract_message(str(tmp_path / "b.png"), streaming=True)
+    assert result["data"] == message
+
+
+def png_chunk_kinds(path):
+    data = path.read_bytes()
+    at, kinds = 8, []
+    while at < len(data):
+        length, kind = struct.unpack(">I4s", data[at : at + 8])
+        kinds.append(kind)
+        at += length + 12
+    return kinds
+
+
+def test_streaming_drops_cover_metadata_like_in_memory(tmp_path):
+    from PIL import PngImagePlugin
+
+    cover = tmp_path / "cover.png"
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Comment", "secret gps")
+    info.add_itxt("Location", "52.1, 4.3")
+    make_noise_cover(str(cover))
+    Image.open(cover).save(cover, pnginfo=info, exif=b"Exif\0\0II*\0", dpi=(72, 72))
+    # A text chunk after the image data as well, which Pillow never writes
+    data = cover.read_bytes()
+    late = steg_hider._png_chunk(b"tEXt", b"Author\0someone")
+    cover.write_bytes(data[:-12] + late + data[-12:])
+
+    texts = []
+    for streaming in (False, True):
+        out = tmp_path / f"stego-{streaming}.png"
+        hide_message(str(cover), "x", str(out), streaming=streaming)
+        with Image.open(out) as img:
+            img.load()
+            texts.append(img.text)
+            assert not {"Comment", "Location", "Author", "exif"} & set(img.info)
+        assert set(png_chunk_kinds(out)) <= steg_hider._PNG_KEPT_CHUNKS | {b"IDAT"}
+    assert texts == [{}, {}]
+    assert png_chunk_kinds(tmp_path / "stego-True.png")[-1] == b"IEND"
+
+
+def test_streaming_rejects_unsupported_covers(tmp_path):
+    cover = tmp_path / "cover.png"
+    Image.new("P", (64, 48)).save(cover)
+    with pytest.raises(ValueError):
+        hide_message(str(cover), "x", str(tmp_path / "o.png"), streaming=True)
+    assert "error" in extract_message(str(cover), streaming=True)
+
+
+def test_extraction_stops_reading_after_the_payload(tmp_path):
+    cover = tmp_path / "cover.png"
+    stego = tmp_path / "stego.png"
+    make_noise_cover(str(cover), size=(400, 300))
+    hide_message(str(cover), "top rows only", str(stego))
+
+    # Drop the back half of the file: the payload rows are all near the top
+    data = stego.read_bytes()
+    stego.write_bytes(data[: len(data) // 2])
+    assert extract_message(str(stego))["data"] == "top rows only"
+    assert "error" in extract_message(str(stego), streaming=False)
+
+
+@pytest.mark.parametrize("suffix", [".bmp", ".ppm"])
+@pytest.mark.parametrize("width", [64, 101])
+def test_memory_mapped_carriers_match_in_memory_embedding(tmp_path, suffix, width):
+    cover = tmp_path / "cover.png"
+    make_noise_cover(str(cover), size=(width, 70))
+    raw_cover = tmp_path / ("cover" + suffix)
+    Image.open(cover).save(raw_cover)
+    message = "mapped " * 300
+    hide_message(str(cover), message, str(tmp_path / "a.png"), bits_per_channel=3)
+    stego = tmp_path / ("stego" + suffix)
+    hide_message(str(raw_cover), message, str(stego), bits_per_channel=3)
+
+    with Image.open(tmp_path / "a.png") as a, Image.open(stego) as b:
+        assert a.tobytes() == b.tobytes()
+    assert extract_message(str(stego))["data"] == message
+    assert raw_cover.read_bytes() != stego.read_bytes()
+
+
+def test_memory_mapped_npy_and_in_place_embedding(tmp_path):
+    cover = tmp_path / "cover.npy"
+    header = b"{'descr': '|u1', 'fortran_order': False, 'shape': (60, 50, 4), }"
+    header = header.ljust(118, b" ") + b"\n"
+    cover.write_bytes(b"\x93NUMPY\x01\x00" + bytes([len(header), 0]) + header)
+    with open(cover, "ab") as fp:
+        fp.write(os.urandom(60 * 50 * 4))
+    size = cover.stat().st_size
+
+    hide_message(str(cover), "in place", str(cover), use_alpha=True)
+    assert cover.stat().st_size == size
+    assert extract_message(str(cover))["data"] == "in place"
+    assert (
+        steg_hider.calculate_capacity(str(cover))
+        == (60 * 50 * 3 - steg_hider.HEADER_LANES) // 8
+    )
+
+
+def test_failed_embedding_closes_the_cover(tmp_path, monkeypatch):
+    opened = []
+    for name in ("_open_mapped", "_open_png_rows"):
+        opener = getattr(steg_hider, name)
+        monkeypatch.setattr(
+            steg_hider,
+            name,
+            lambda path, opener=opener: opened.append(opener(path)) or opened[-1],
+        )
+    rng = random.Random(2)
+    message = "".join(chr(rng.randrange(33, 123)) for _ in range(5000))
+    make_noise_cover(str(tmp_path / "cover.png"))
+    Image.open(tmp_path / "cover.png").save(tmp_path / "cover.bmp")
+    for cover, options in (("cover.bmp", {}), ("cover.png", {"streaming": True})):
+        out = str(tmp_path / ("out" + os.path.splitext(cover)[1]))
+        with pytest.raises(ValueError):
+            hide_message(str(tmp_path / cover), message, out, **options)
+    mapped, streamed = [h for h in opened if h is not None]
+    assert mapped._map.closed and streamed._fp.closed
+
+
+def test_in_memory_inputs_and_outputs(tmp_path):
+    cover = tmp_path / "cover.png"
+    make_noise_cover(str(cover))
+    data = cover.read_bytes()
+    hide_message(str(cover), "on disk", str(tmp_path / "disk.png"))
+    expected = Image.open(tmp_path / "disk.png").tobytes()
+
+    image = Image.open(cover)
+    pixels = image.tobytes()
+    for source in (data, io.BytesIO(data), image, bytearray(data)):
+        result = hide_message(source, "on disk")
+        assert result["output"][:8] == b"\x89PNG\r\n\x1a\n"
+        assert Image.open(io.BytesIO(result["output"])).tobytes() == expected
+    assert image.tobytes() == pixels  # the caller's image is left alone
+
+    stream = io.BytesIO()
+    assert hide_message(image, "to a stream", stream)["output"] is stream
+    stego = stream.getvalue()
+    for source in (stego, io.BytesIO(stego), Image.open(io.BytesIO(stego))):
+        assert extract_message(source)["data"] == "to a stream"
+    capacity = (64 * 48 * 3 - steg_hider.HEADER_LANES) // 8
+    if steg_hider.np is not None:
+        array = steg_hider.np.asarray(Image.open(io.BytesIO(stego)))
+        assert extract_message(array)["data"] == "to a stream"
+        assert steg_hider.calculate_capacity(array) == capacity
+
+    assert steg_hider.calculate_capacity(data) == capacity
+    wiped = steg_hider.metawipe_image(data)
+    assert Image.open(io.BytesIO(wiped)).tobytes() == pixels
+    with pytest.raises(ValueError):
+        hide_message(data, "x", streaming=True)
+    assert "error" in extract_message(12)
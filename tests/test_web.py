@@ -0,0 +1,96 @@
+import importlib.util
+import io
+import os
+import sys
+
+from PIL import Image
+import pytest
+
+import steg_hider
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+@pytest.fixture
+def client(monkeypatch):
+    pytest.importorskip("flask")
+    pytest.importorskip("qrcode")
+    # Each app starts with empty metrics and its own stage hook
+    monkeypatch.setattr(steg_hider, "_metric_values", {})
+    monkeypatch.setattr(steg_hider, "STAGE_HOOKS", [])
+    spec = importlib.util.spec_from_file_location(
+        "steghider_api", os.path.join(ROOT, "api", "index.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    # Flask finds the templates relative to the module's file
+    monkeypatch.setitem(sys.modules, spec.name, module)
+    spec.loader.exec_module(module)
+    return module.app.test_client()
+
+
+def png_upload(size=(200, 100)):
+    buf = io.BytesIO()
+    Image.effect_noise(size, 64).convert("RGB").save(buf, format="PNG")
+    buf.seek(0)
+    return buf, "cover.png"
+
+
+def test_metrics_endpoint(client):
+    response = client.post(
+        "/embed",
+        data={"image": png_upload(), "message": "metered ✓"},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 200
+    stego = (io.BytesIO(response.data), "stego.png")
+    response = client.post(
+        "/extract", data={"image": stego}, content_type="multipart/form-data"
+    )
+    assert response.status_code == 200
+    assert b"metered" in response.data
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    for line in (
+        'steghider_http_requests_total{method="POST",route="/embed",status="200"} 1',
+        'steghider_http_request_duration_seconds_count{route="/extract"} 1',
+        'steghider_image_megapixels_bucket{route="/embed",le="0.1"} 1',
+        'steghider_payload_bytes_sum{operation="embed"} 11.0',
+        'steghider_payload_bytes_sum{operation="extract"} 11.0',
+        'steghider_stage_duration_seconds_count{operation="hide",stage="embed"} 1',
+        'steghider_stage_duration_seconds_count{operation="extract",stage="read"} 1',
+    ):
+        assert line in text
+    assert 'steghider_http_uploaded_bytes_total{route="/embed"}' in text
+
+
+def test_routes_run_in_memory(client, tmp_path):
+    client.application.config["UPLOAD_FOLDER"] = str(tmp_path)
+    response = client.post(
+        "/embed",
+        data={"image": png_upload(), "message": "no temp files"},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    stego = response.data
+
+    response = client.post(
+        "/extract",
+        data={"image": (io.BytesIO(stego), "stego.png")},
+        content_type="multipart/form-data",
+    )
+    assert b"no temp files" in response.data
+
+    response = client.post(
+        "/metawipe",
+        data={"image": (io.BytesIO(stego), "stego.png")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 200
+    assert Image.open(io.BytesIO(response.data)).tobytes() == (
+        Image.open(io.BytesIO(stego)).tobytes()
+    )
+    assert os.listdir(tmp_path) == []